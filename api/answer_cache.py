@@ -0,0 +1,72 @@
+from threading import Lock
+import numpy as np
+import os
+import time
+from dotenv import load_dotenv
+
+load_dotenv(override=True)
+
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "256"))
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", "1800"))
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+
+
+class AnswerCache:
+
+    """
+    질문 임베딩 유사도로 찾는 답변 캐시
+
+    압축된 질문의 임베딩과 코사인 유사도가 threshold 이상인 이전 질문이 있으면 그 답변과 출처를 돌려준다.
+    데이터 버전(색인 데이터, 가격 저장소)이 바뀌면 저장된 답변은 모두 무효가 된다.
+    """
+
+    def __init__(self, maxsize=ANSWER_CACHE_SIZE, ttl=ANSWER_CACHE_TTL, threshold=ANSWER_CACHE_THRESHOLD):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.threshold = threshold
+        self.version = None
+        self.vectors = np.empty((0, 0), dtype=np.float32)
+        self.entries = []
+        self.lock = Lock()
+
+    def _invalidate(self, version):
+        if version != self.version:
+            self.version = version
+            self.vectors = np.empty((0, 0), dtype=np.float32)
+            self.entries = []
+
+    def _evict_expired(self):
+        now = time.monotonic()
+        keep = [i for i, entry in enumerate(self.entries) if now - entry["created_at"] <= entry["ttl"]]
+        if len(keep) != len(self.entries):
+            self.vectors = self.vectors[keep]
+            self.entries = [self.entries[i] for i in keep]
+
+    def get(self, vector, version):
+        query = np.asarray(vector, dtype=np.float32)
+        query /= np.linalg.norm(query)
+        with self.lock:
+            self._invalidate(version)
+            self._evict_expired()
+            if not self.entries:
+                return None
+            similarities = self.vectors @ query
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                return None
+            return self.entries[best]
+
+    def put(self, vector, version, answer, sources, ttl=None):
+
+        """
+        ttl을 주면 이 답변은 캐시의 ttl과 둘 중 짧은 시간 동안만 유지된다 (실시간 시세를 본 답변 등)
+        """
+        row = np.asarray(vector, dtype=np.float32)
+        row /= np.linalg.norm(row)
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        entry = {"answer": answer, "sources": sources, "created_at": time.monotonic(), "ttl": ttl}
+        with self.lock:
+            self._invalidate(version)
+            vectors = self.vectors if self.entries else np.empty((0, row.shape[0]), dtype=np.float32)
+            self.vectors = np.vstack([vectors, row])[-self.maxsize:]
+            self.entries = (self.entries + [entry])[-self.maxsize:]
@@ -1,7 +1,7 @@
 from flask import Flask, jsonify, request, Response
 from flask_cors import CORS
 from uuid import uuid4
-from chat import ask_question
+from chat import ask_question, evaluation_queue
 import os
 import sys
 import click
@@ -31,6 +31,15 @@ def api_chat():
     session_id = request.args.get("session_id", str(uuid4()))
     return Response(ask_question(question, session_id), mimetype="text/event-stream")
 
+
+@app.route("/api/eval", methods=["GET"])
+def api_eval():
+    session_id = request.args.get("session_id")
+    if session_id is None:
+        return jsonify({"msg": "Missing session_id from request args"}), 400
+
+    return jsonify(evaluation_queue.results(session_id, request.args.get("eval_id")))
+
 @app.cli.command()
 @click.option('--length', default=50)
 @click.option('--day_before', default=1)
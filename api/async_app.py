@@ -0,0 +1,76 @@
+from aiohttp import web
+from uuid import uuid4
+from async_chat import ask_question_async
+from chat import evaluation_queue
+from elasticsearch_client import async_elasticsearch_client
+import asyncio
+import os
+from dotenv import load_dotenv
+
+load_dotenv(override=True)
+
+basedir = os.path.abspath(os.path.dirname(__file__))
+static_folder = os.path.join(basedir, "../frontend/build")
+ASYNC_APP_PORT = int(os.getenv("ASYNC_APP_PORT", "5000"))
+
+routes = web.RouteTableDef()
+
+
+@web.middleware
+async def cors_middleware(request, handler):
+    # flask_cors의 CORS(app) 기본 설정과 같이 모든 origin을 허용한다
+    if request.method == "OPTIONS":
+        response = web.Response()
+    else:
+        response = await handler(request)
+    response.headers["Access-Control-Allow-Origin"] = "*"
+    response.headers["Access-Control-Allow-Headers"] = request.headers.get("Access-Control-Request-Headers", "*")
+    response.headers["Access-Control-Allow-Methods"] = "GET, POST, OPTIONS"
+    return response
+
+
+@routes.get("/")
+async def api_index(request):
+    return web.FileResponse(os.path.join(static_folder, "index.html"))
+
+
+@routes.post("/api/chat")
+async def api_chat(request):
+    request_json = await request.json()
+    question = request_json.get("question")
+    if question is None:
+        return web.json_response({"msg": "Missing question from request JSON"}, status=400)
+
+    session_id = request.query.get("session_id", str(uuid4()))
+    response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+    await response.prepare(request)
+    async for event in ask_question_async(question, session_id):
+        await response.write(event.encode("utf-8"))
+    await response.write_eof()
+    return response
+
+
+@routes.get("/api/eval")
+async def api_eval(request):
+    session_id = request.query.get("session_id")
+    if session_id is None:
+        return web.json_response({"msg": "Missing session_id from request args"}, status=400)
+
+    return web.json_response(await asyncio.to_thread(evaluation_queue.results, session_id, request.query.get("eval_id")))
+
+
+async def close_clients(app):
+    await async_elasticsearch_client.close()
+
+
+def create_app():
+    app = web.Application(middlewares=[cors_middleware])
+    app.add_routes(routes)
+    app.on_cleanup.append(close_clients)
+    if os.path.isdir(static_folder):
+        app.router.add_static("/", static_folder)
+    return app
+
+
+if __name__ == "__main__":
+    web.run_app(create_app(), port=ASYNC_APP_PORT)
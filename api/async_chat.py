@@ -0,0 +1,114 @@
+from llm_integrations import get_llm
+from elasticsearch_client import async_elasticsearch_client
+from retrieval import afetch_concurrently, asearch_indexes, RETRIEVAL_SEARCHES, RETRIEVAL_TIMEOUT, REAL_TIME_TIMEOUT
+from query_embedding import aembed_query
+from evaluation import EVAL_INLINE, EVAL_INLINE_TIMEOUT
+from chat import (
+    SESSION_ID_TAG,
+    DONE_TAG,
+    answer_cache,
+    session_history,
+    format_answer_event,
+    format_eval_event,
+    format_eval_id_event,
+    format_source_event,
+    replay_cached_answer,
+    select_context,
+    rag_prompt_variables,
+    finish_turn,
+    answer_cache_version,
+    PRICE_TOOLS,
+    PRICE_TOOL_TIMEOUT,
+    call_price_tools,
+    is_price_question,
+)
+from jinja2 import Environment, FileSystemLoader
+from datetime import date
+import asyncio
+import logging
+import os
+import sys
+
+basedir = os.path.abspath(os.path.dirname(__file__))
+sys.path.append(f"{basedir}/../")
+from data.quote_cache import quote_cache
+
+logger = logging.getLogger(__name__)
+templates = Environment(loader=FileSystemLoader(os.path.join(basedir, "templates")))
+
+
+async def aanalyze_prices(question, price_tool_prompt):
+    if not is_price_question(question):
+        return []
+    response = await get_llm(stage="tool").bind_tools(PRICE_TOOLS).ainvoke(price_tool_prompt)
+    return await asyncio.to_thread(call_price_tools, response.tool_calls)
+
+
+async def ask_question_async(question, session_id):
+    """ask_question과 같은 SSE 이벤트를 만드는 asyncio 버전"""
+    yield f"data: {SESSION_ID_TAG} {session_id}\n\n"
+    logger.debug("Chat session ID: %s", session_id)
+
+    chat_history = await session_history.amessages(session_id)
+
+    if len(chat_history) > 0:
+        # create a condensed question
+        condense_question_prompt = templates.get_template("condense_question_prompt.txt").render(
+            question=question,
+            chat_history=chat_history,
+        )
+        condensed_question = (await get_llm(stage="condense").ainvoke(condense_question_prompt)).content
+    else:
+        condensed_question = question
+
+    logger.debug("Condensed question: %s", condensed_question)
+    logger.debug("Question: %s", question)
+
+    query_vector = await aembed_query(condensed_question)
+    data_version = answer_cache_version()
+    cached = answer_cache.get(query_vector, data_version)
+    if cached is not None:
+        logger.debug("Answer cache hit: %s", condensed_question)
+        for event in replay_cached_answer(cached, session_id, question):
+            yield event
+        return
+
+    price_tool_prompt = templates.get_template("price_tool_prompt.txt").render(
+        question=condensed_question,
+        today=date.today().isoformat(),
+    )
+    retrieved = await afetch_concurrently({
+        "docs": (lambda: asearch_indexes(async_elasticsearch_client, query_vector, RETRIEVAL_SEARCHES), RETRIEVAL_TIMEOUT, []),
+        "stock_info": (lambda: asyncio.to_thread(quote_cache.get, REAL_TIME_TIMEOUT), REAL_TIME_TIMEOUT, {}),
+        "price_analysis": (lambda: aanalyze_prices(condensed_question, price_tool_prompt), PRICE_TOOL_TIMEOUT, []),
+    })
+    docs, doc_sources, context = select_context(retrieved)
+    for doc_source in doc_sources:
+        yield format_source_event(doc_source)
+
+    qa_prompt = templates.get_template("rag_prompt.txt").render(
+        **rag_prompt_variables(question, docs, chat_history, retrieved),
+    )
+
+    answer = ""
+    async for chunk in get_llm().astream(qa_prompt):
+        yield format_answer_event(chunk.content)
+        answer += chunk.content
+
+    yield f"data: {DONE_TAG}\n\n"
+
+    evaluation = finish_turn(
+        session_id, question, answer, query_vector, data_version, docs, doc_sources, context, retrieved["stock_info"]
+    )
+    if evaluation is None:
+        return
+    eval_id, future = evaluation
+    yield format_eval_id_event(eval_id)
+    if EVAL_INLINE:
+        # 시간이 지나도 평가 작업은 취소하지 않는다 (취소되면 큐 자리를 반납하지 못한다)
+        try:
+            result = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), EVAL_INLINE_TIMEOUT)
+        except asyncio.TimeoutError:
+            result = None
+        if result is not None:
+            yield format_eval_event(result)
@@ -1,121 +1,320 @@
-from langchain_elasticsearch import ElasticsearchStore
 from llm_integrations import get_llm
-from elasticsearch_client import (
-    elasticsearch_client,
-    get_elasticsearch_chat_message_history,
-)
-from langchain_openai import OpenAIEmbeddings
+from elasticsearch_client import elasticsearch_client, async_elasticsearch_client
+from session_history import SessionHistory
+from answer_cache import AnswerCache
+from evaluation import EvaluationQueue, EVAL_INLINE, EVAL_INLINE_TIMEOUT
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from retrieval import fetch_concurrently, search_indexes, RETRIEVAL_SEARCHES, RETRIEVAL_TIMEOUT, REAL_TIME_TIMEOUT
+from query_embedding import embed_query
+from context_builder import build_context
 from flask import render_template, stream_with_context, current_app
+from datetime import date
 import json
+import logging
 import os
+import re
 import sys
-from trulens_eval.feedback.provider import OpenAI
 from langchain_core.tools import tool
 from dotenv import load_dotenv
 
 basedir = os.path.abspath(os.path.dirname(__file__))
 sys.path.append(f"{basedir}/../")
-from data import korea_investment
+from data.quote_cache import quote_cache, QUOTE_CACHE_TTL
+from data.data_version import get_data_version
+from data.price_store import price_store
+from data import price_analytics
 
 load_dotenv(override=True)
 
-NEWS_INDEX = "news"
-STOCK_INDEX = "stock"
-REPORT_INDEX = "report"
+logger = logging.getLogger(__name__)
+
 INDEX_CHAT_HISTORY = "chat-history"
+INDEX_CHAT_EVAL = "chat-eval"
 SESSION_ID_TAG = "[SESSION_ID]"
 SOURCE_TAG = "[SOURCE]"
 DONE_TAG = "[DONE]"
 EVAL_TAG = "[EVAL]"
+EVAL_ID_TAG = "[EVAL_ID]"
 
-embedding = OpenAIEmbeddings(openai_api_key=os.getenv("OPENAI_API_KEY"), model="text-embedding-3-small")
-news_store = ElasticsearchStore(
-    es_connection=elasticsearch_client,
-    index_name=NEWS_INDEX,
-    embedding=embedding,
-)
-stock_store = ElasticsearchStore(
-    es_connection=elasticsearch_client,
-    index_name=STOCK_INDEX,
-    embedding=embedding,
-)
-report_store = ElasticsearchStore(
-    es_connection=elasticsearch_client,
-    index_name=REPORT_INDEX,
-    embedding=embedding,
+# 가격 분석이 첫 [SOURCE] 이벤트를 문서 검색보다 오래 붙잡지 않도록 RETRIEVAL_TIMEOUT을 넘기지 않는다
+PRICE_TOOL_TIMEOUT = min(float(os.getenv("PRICE_TOOL_TIMEOUT", str(RETRIEVAL_TIMEOUT))), RETRIEVAL_TIMEOUT)
+# 과거 주가를 묻는 질문에만 가격 분석 도구 호출(LLM 왕복)을 한다
+PRICE_QUESTION_PATTERN = re.compile(
+    r"주가|가격|시세|종가|시가|최고가|최저가|수익률|등락|상승|하락|올랐|오른|내렸|내린|떨어|"
+    r"이동\s*평균|이평|변동성|변동폭|낙폭|고점|저점|MDD|"
+    r"price|return|moving average|volatility|drawdown",
+    re.IGNORECASE,
 )
 
+session_history = SessionHistory(elasticsearch_client, INDEX_CHAT_HISTORY, async_client=async_elasticsearch_client)
+answer_cache = AnswerCache()
+evaluation_queue = EvaluationQueue(elasticsearch_client, INDEX_CHAT_EVAL)
+
+
+@tool
+def price_return(ticker: str, start_date: str, end_date: str) -> dict:
+    """Price change of one stock between two dates: first/last close, change, return in percent, highest and lowest close.
+
+    Args:
+        ticker: one of samsung, skhynix, nvidia, amd
+        start_date: first day of the period (YYYY-MM-DD)
+        end_date: last day of the period (YYYY-MM-DD)
+    """
+    return price_analytics.period_return(ticker, start_date, end_date)
+
+
+@tool
+def price_moving_average(ticker: str, end_date: str, window: int = 20) -> dict:
+    """Moving average of closing prices over the last `window` trading days up to end_date, and how far the last close is from it.
+
+    Args:
+        ticker: one of samsung, skhynix, nvidia, amd
+        end_date: last day of the window (YYYY-MM-DD)
+        window: number of trading days (e.g. 5, 20, 60, 120)
+    """
+    return price_analytics.moving_average(ticker, end_date, window)
+
+
+@tool
+def price_volatility(ticker: str, start_date: str, end_date: str) -> dict:
+    """Daily and annualized volatility of a stock's daily log returns over a period.
+
+    Args:
+        ticker: one of samsung, skhynix, nvidia, amd
+        start_date: first day of the period (YYYY-MM-DD)
+        end_date: last day of the period (YYYY-MM-DD)
+    """
+    return price_analytics.volatility(ticker, start_date, end_date)
+
+
+@tool
+def price_max_drawdown(ticker: str, start_date: str, end_date: str) -> dict:
+    """Largest peak-to-trough fall of a stock's closing price within a period, with the peak and trough dates.
+
+    Args:
+        ticker: one of samsung, skhynix, nvidia, amd
+        start_date: first day of the period (YYYY-MM-DD)
+        end_date: last day of the period (YYYY-MM-DD)
+    """
+    return price_analytics.max_drawdown(ticker, start_date, end_date)
+
+
+@tool
+def price_compare_returns(tickers: list[str], start_date: str, end_date: str) -> list[dict]:
+    """Compare the returns of several stocks over the same period, highest first.
+
+    Args:
+        tickers: any of samsung, skhynix, nvidia, amd
+        start_date: first day of the period (YYYY-MM-DD)
+        end_date: last day of the period (YYYY-MM-DD)
+    """
+    return price_analytics.compare_returns(tickers, start_date, end_date)
+
+
+PRICE_TOOLS = [price_return, price_moving_average, price_volatility, price_max_drawdown, price_compare_returns]
+PRICE_TOOLS_BY_NAME = {price_tool.name: price_tool for price_tool in PRICE_TOOLS}
+
+
+def call_price_tools(tool_calls):
+    """모델이 요청한 가격 분석 도구를 실행하고 {name, args, result} 목록으로 돌려준다. 실패한 호출은 빠진다."""
+    results = []
+    for tool_call in tool_calls:
+        try:
+            result = PRICE_TOOLS_BY_NAME[tool_call["name"]].invoke(tool_call["args"])
+        except Exception:
+            logger.warning("Price tool %s(%s) failed", tool_call["name"], tool_call["args"], exc_info=True)
+            continue
+        results.append({"name": tool_call["name"], "args": tool_call["args"], "result": result})
+    return results
+
+
+def is_price_question(question):
+    return PRICE_QUESTION_PATTERN.search(question) is not None
+
+
+def analyze_prices(question, price_tool_prompt):
+    if not is_price_question(question):
+        return []
+    response = get_llm(stage="tool").bind_tools(PRICE_TOOLS).invoke(price_tool_prompt)
+    return call_price_tools(response.tool_calls)
+
+
+def without_stock_docs(scored_docs):
+    # 가격 분석 도구가 하나라도 결과를 냈을 때만 주가 문서 검색 결과를 뺀다
+    return [(doc, score) for doc, score in scored_docs if doc.metadata.get("category") != "stock"]
+
+
+def format_price_analysis(price_analysis):
+    return "".join(
+        f"price_analysis: {analysis['name']}({json.dumps(analysis['args'], ensure_ascii=False)}) = "
+        f"{json.dumps(analysis['result'], ensure_ascii=False)}\n"
+        for analysis in price_analysis
+    )
+
+
+def split_sources(answer):
+    index = answer.find("SOURCES:")
+    if index == -1:
+        return answer, None
+    return answer[:index].strip(), answer[index + len("SOURCES:"):].strip()
+
+
+def format_eval_event(result):
+    return f"data: {EVAL_TAG} Context Relavance: {result['context_relevance']}, Groundedness: {result['groundedness']}, Answer Relavance: {result['answer_relevance']}\n\n"
+
+
+def format_eval_id_event(eval_id):
+    return f"data: {EVAL_ID_TAG} {eval_id}\n\n"
+
+
+def format_source_event(doc_source):
+    return f"data: {SOURCE_TAG} {json.dumps(doc_source)}\n\n"
+
+
+def format_answer_event(content):
+    return f"data: {content.replace(chr(10), ' ')}\n\n"
+
+
+def replay_cached_answer(cached, session_id, question):
+
+    """
+    캐시된 답변을 새로 만든 답변과 같은 SSE 이벤트로 돌려주고 대화 기록에 남긴다
+    """
+    events = [format_source_event(doc_source) for doc_source in cached["sources"]]
+    events.append(format_answer_event(cached["answer"]))
+    events.append(f"data: {DONE_TAG}\n\n")
+    answer, _ = split_sources(cached["answer"])
+    session_history.add_turn(session_id, question, answer)
+    return events
+
+
+def select_context(retrieved):
+
+    """
+    동시에 가져온 검색 결과로 답변에 쓸 문서와 평가용 context를 만든다
+
+    Returns:
+        (docs, doc_sources, context)
+    """
+    price_analysis = retrieved["price_analysis"]
+    logger.debug("Price analysis: %s", price_analysis)
+    scored_docs = without_stock_docs(retrieved["docs"]) if price_analysis else retrieved["docs"]
+    docs = build_context(scored_docs)
+    context = format_price_analysis(price_analysis)
+    doc_sources = []
+    for doc in docs:
+        doc_sources.append({**doc.metadata, "page_content": doc.page_content})
+        context += "source_name: " + doc.metadata['name'] + "\n" + "source_content: " + doc.page_content + "\n"
+        logger.debug("Retrieved document passage from: %s", doc.metadata["name"])
+    return docs, doc_sources, context
+
+
+def rag_prompt_variables(question, docs, chat_history, retrieved):
+    return {
+        "question": question,
+        "docs": docs,
+        "chat_history": chat_history,
+        "stock_info": retrieved["stock_info"],
+        "price_analysis": retrieved["price_analysis"],
+    }
+
+
+def answer_cache_version():
+    # 30초마다 바뀌는 실시간 시세가 아니라 색인 데이터나 가격 분석이 읽는 가격 저장소가 바뀔 때만 캐시를 비운다
+    return get_data_version(), price_store.version()
+
+
+def finish_turn(session_id, question, answer, query_vector, data_version, docs, doc_sources, context, stock_info):
+
+    """
+    스트리밍이 끝난 답변을 캐시와 대화 기록에 남기고 평가를 큐에 넣는다
+
+    Returns:
+        (eval_id, Future), 평가하지 않으면 None
+    """
+    logger.debug("Answer: %s", answer)
+    full_answer = answer
+    answer, sources = split_sources(answer)
+    # 실시간 시세만으로 한 답변(SOURCES 없음)은 시세가 바뀌면 틀리므로 캐시하지 않고,
+    # 출처가 있어도 프롬프트에 시세가 들어간 답변은 시세 캐시가 갱신되는 주기까지만 재사용한다
+    if docs and sources:
+        ttl = QUOTE_CACHE_TTL if stock_info else None
+        answer_cache.put(query_vector, data_version, full_answer, doc_sources, ttl=ttl)
+
+    session_history.add_turn(session_id, question, answer)
+
+    if not sources:
+        return None
+    return evaluation_queue.submit(session_id, question, answer, context)
+
 
 @stream_with_context
 def ask_question(question, session_id):
     yield f"data: {SESSION_ID_TAG} {session_id}\n\n"
     current_app.logger.debug("Chat session ID: %s", session_id)
 
-    chat_history = get_elasticsearch_chat_message_history(
-        INDEX_CHAT_HISTORY, session_id
-    )
+    chat_history = session_history.messages(session_id)
 
-    if len(chat_history.messages) > 0:
+    if len(chat_history) > 0:
         # create a condensed question
         condense_question_prompt = render_template(
             "condense_question_prompt.txt",
             question=question,
-            chat_history=chat_history.messages,
+            chat_history=chat_history,
         )
-        condensed_question = get_llm().invoke(condense_question_prompt).content
+        condensed_question = get_llm(stage="condense").invoke(condense_question_prompt).content
     else:
         condensed_question = question
 
     current_app.logger.debug("Condensed question: %s", condensed_question)
     current_app.logger.debug("Question: %s", question)
 
-    news = news_store.as_retriever().invoke(condensed_question)
-    stock = stock_store.as_retriever(search_kwargs={'k': 2}).invoke(condensed_question)
-    reports = report_store.as_retriever().invoke(condensed_question)
-    docs = news + stock + reports
-    context=""
-    for doc in docs:
-        doc_source = {**doc.metadata, "page_content": doc.page_content}
-        context += "source_name: " + doc.metadata['name'] + "\n" + "source_content: " + doc.page_content + "\n"
-        current_app.logger.debug(
-            "Retrieved document passage from: %s", doc.metadata["name"]
-        )
-        yield f"data: {SOURCE_TAG} {json.dumps(doc_source)}\n\n"
-    stock_info = korea_investment.fetch_real_time_all()
-    
+    query_vector = embed_query(condensed_question)
+    data_version = answer_cache_version()
+    cached = answer_cache.get(query_vector, data_version)
+    if cached is not None:
+        current_app.logger.debug("Answer cache hit: %s", condensed_question)
+        yield from replay_cached_answer(cached, session_id, question)
+        return
+
+    price_tool_prompt = render_template(
+        "price_tool_prompt.txt",
+        question=condensed_question,
+        today=date.today().isoformat(),
+    )
+    retrieved = fetch_concurrently({
+        "docs": (lambda: search_indexes(elasticsearch_client, query_vector, RETRIEVAL_SEARCHES), RETRIEVAL_TIMEOUT, []),
+        "stock_info": (lambda: quote_cache.get(timeout=REAL_TIME_TIMEOUT), REAL_TIME_TIMEOUT, {}),
+        "price_analysis": (lambda: analyze_prices(condensed_question, price_tool_prompt), PRICE_TOOL_TIMEOUT, []),
+    })
+    docs, doc_sources, context = select_context(retrieved)
+    for doc_source in doc_sources:
+        yield format_source_event(doc_source)
+
     qa_prompt = render_template(
         "rag_prompt.txt",
-        question=question,
-        docs=docs,
-        chat_history=chat_history.messages,
-        stock_info=stock_info,
+        **rag_prompt_variables(question, docs, chat_history, retrieved),
     )
 
     answer = ""
     for chunk in get_llm().stream(qa_prompt):
-        content = chunk.content.replace(
-            "\n", " "
-        ) 
-        yield f"data: {content}\n\n"
+        yield format_answer_event(chunk.content)
         answer += chunk.content
 
     yield f"data: {DONE_TAG}\n\n"
-    current_app.logger.debug("Answer: %s", answer)
-
-    index = answer.find("SOURCES:")
-    sources = None
-    if index != -1:
-        sources = answer[index + len("SOURCES:"):].strip()
-        answer = answer[:index].strip()
-
-    if sources:
-        provider = OpenAI(model_engine="gpt-4o")
-        answer_relevance = provider.relevance(prompt=question, response=answer)
-        context_relevance, context_relevance_reason = provider.context_relevance_with_cot_reasons(question=question, context=context)
-        groundedness, groundedness_reason  = provider.groundedness_measure_with_cot_reasons(source=context, statement=answer)
-        yield f"data: {EVAL_TAG} Context Relavance: {context_relevance}, Groundedness: {groundedness}, Answer Relavance: {answer_relevance}\n\n"
-
-    chat_history.add_user_message(question)
-    chat_history.add_ai_message(answer)
-
 
+    evaluation = finish_turn(
+        session_id, question, answer, query_vector, data_version, docs, doc_sources, context, retrieved["stock_info"]
+    )
+    if evaluation is None:
+        return
+    # 평가 결과는 /api/eval?session_id=...&eval_id=...로 조회한다
+    eval_id, future = evaluation
+    yield format_eval_id_event(eval_id)
+    if EVAL_INLINE:
+        try:
+            result = future.result(timeout=EVAL_INLINE_TIMEOUT)
+        except FutureTimeoutError:
+            result = None
+        if result is not None:
+            yield format_eval_event(result)
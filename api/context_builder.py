@@ -0,0 +1,133 @@
+from langchain_core.documents import Document
+import os
+import tiktoken
+from dotenv import load_dotenv
+
+load_dotenv(override=True)
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "6000"))
+CONTEXT_DUPLICATE_THRESHOLD = float(os.getenv("CONTEXT_DUPLICATE_THRESHOLD", "0.8"))
+MIN_OVERLAP_CHARS = 32
+# 분할기가 청크 사이의 공백을 지우므로 이 정도 떨어진 청크까지는 이어진 것으로 본다
+MAX_ADJACENT_GAP_CHARS = 8
+SHINGLE_SIZE = 5
+
+encoding = tiktoken.get_encoding("cl100k_base")
+
+
+def _overlap_merge(first, second):
+    """first의 끝과 second의 앞이 겹치면 이어 붙인 문자열을, 아니면 None을 돌려준다."""
+    if second in first:
+        return first
+    head = second[:MIN_OVERLAP_CHARS]
+    start = first.find(head)
+    while start != -1:
+        tail = first[start:]
+        if second.startswith(tail):
+            return first + second[len(tail):]
+        start = first.find(head, start + 1)
+    return None
+
+
+def _merge_by_position(scored_docs):
+    """분할할 때 기록한 start_index 순서로 한 번 훑으며 겹치거나 맞닿은 청크를 잇는다."""
+    merged = []
+    end = None
+    for doc, score in sorted(scored_docs, key=lambda item: item[0].metadata["start_index"]):
+        start = doc.metadata["start_index"]
+        if merged and start <= end + MAX_ADJACENT_GAP_CHARS:
+            other, other_score = merged[-1]
+            if start <= end:
+                text = other.page_content + doc.page_content[end - start:]
+            else:
+                text = other.page_content + " " + doc.page_content
+            merged[-1] = (Document(page_content=text, metadata=other.metadata), max(score, other_score))
+            end = max(end, start + len(doc.page_content))
+        else:
+            merged.append((doc, score))
+            end = start + len(doc.page_content)
+    return merged
+
+
+def _merge_by_overlap(scored_docs):
+    """위치 정보가 없는 청크는 내용이 겹치는 쌍을 더 이상 없을 때까지 합친다."""
+    merged = list(scored_docs)
+    changed = True
+    while changed:
+        changed = False
+        for i in range(len(merged)):
+            for j in range(i + 1, len(merged)):
+                (doc, score), (other, other_score) = merged[i], merged[j]
+                text = _overlap_merge(doc.page_content, other.page_content) or _overlap_merge(other.page_content, doc.page_content)
+                if text is not None:
+                    merged[i] = (Document(page_content=text, metadata=doc.metadata), max(score, other_score))
+                    del merged[j]
+                    changed = True
+                    break
+            if changed:
+                break
+    return merged
+
+
+def _merge_same_source(scored_docs):
+    positioned = [(doc, score) for doc, score in scored_docs if doc.metadata.get("start_index") is not None]
+    unpositioned = [(doc, score) for doc, score in scored_docs if doc.metadata.get("start_index") is None]
+    return _merge_by_position(positioned) + _merge_by_overlap(unpositioned)
+
+
+def _shingles(text):
+    text = " ".join(text.split())
+    return {text[i:i + SHINGLE_SIZE] for i in range(max(1, len(text) - SHINGLE_SIZE + 1))}
+
+
+def _is_duplicate(shingles, selected_shingles):
+    # 이미 고른 문서에 대부분 포함된 문서는 중복으로 본다
+    for other in selected_shingles:
+        if len(shingles & other) / len(shingles) >= CONTEXT_DUPLICATE_THRESHOLD:
+            return True
+    return False
+
+
+def build_context(scored_docs, token_budget=CONTEXT_TOKEN_BUDGET):
+    """
+    검색 결과를 프롬프트에 넣을 문서 목록으로 정리한다.
+
+    같은 출처에서 겹치거나 이어지는 청크는 하나로 합치고, 거의 같은 내용의 문서는 버린 뒤
+    점수가 높은 순서대로 token_budget 토큰까지 채운다.
+
+    Args:
+        scored_docs: (Document, 점수) 목록
+
+    Returns:
+        Document 목록 (점수 내림차순)
+    """
+    groups = dict()
+    for doc, score in scored_docs:
+        key = doc.metadata.get("url") or doc.metadata.get("name")
+        groups.setdefault(key, []).append((doc, score))
+
+    candidates = []
+    for group in groups.values():
+        candidates.extend(_merge_same_source(group))
+    candidates.sort(key=lambda item: item[1], reverse=True)
+
+    docs = []
+    selected_shingles = []
+    remaining = token_budget
+    for doc, _ in candidates:
+        shingles = _shingles(doc.page_content)
+        if _is_duplicate(shingles, selected_shingles):
+            continue
+        tokens = encoding.encode(doc.page_content)
+        if len(tokens) > remaining:
+            if docs:
+                continue
+            # 가장 관련도가 높은 문서 하나가 예산보다 크면 잘라서라도 넣는다
+            doc = Document(page_content=encoding.decode(tokens[:remaining]), metadata=doc.metadata)
+            tokens = tokens[:remaining]
+        docs.append(doc)
+        selected_shingles.append(shingles)
+        remaining -= len(tokens)
+        if remaining <= 0:
+            break
+    return docs
@@ -1,5 +1,4 @@
-from elasticsearch import Elasticsearch
-from langchain_elasticsearch import ElasticsearchChatMessageHistory
+from elasticsearch import AsyncElasticsearch, Elasticsearch
 import os
 from dotenv import load_dotenv
 
@@ -13,13 +12,11 @@ if ELASTIC_CLOUD_ID:
     elasticsearch_client = Elasticsearch(
         cloud_id=ELASTIC_CLOUD_ID, api_key=ELASTIC_API_KEY
     )
+    async_elasticsearch_client = AsyncElasticsearch(
+        cloud_id=ELASTIC_CLOUD_ID, api_key=ELASTIC_API_KEY
+    )
 else:
     raise ValueError(
         "Please provide either ELASTICSEARCH_URL or ELASTIC_CLOUD_ID and ELASTIC_API_KEY"
     )
 
-
-def get_elasticsearch_chat_message_history(index, session_id):
-    return ElasticsearchChatMessageHistory(
-        es_connection=elasticsearch_client, index=index, session_id=session_id
-    )
@@ -0,0 +1,130 @@
+from concurrent.futures import ThreadPoolExecutor
+from threading import BoundedSemaphore, Lock
+from time import time
+from uuid import uuid4
+from trulens_eval.feedback.provider import OpenAI
+import logging
+import os
+import random
+from dotenv import load_dotenv
+
+load_dotenv(override=True)
+
+EVAL_MODEL = os.getenv("EVAL_MODEL", "gpt-4o")
+EVAL_SAMPLE_RATE = float(os.getenv("EVAL_SAMPLE_RATE", "1.0"))
+EVAL_MAX_WORKERS = int(os.getenv("EVAL_MAX_WORKERS", "2"))
+EVAL_QUEUE_SIZE = int(os.getenv("EVAL_QUEUE_SIZE", "32"))
+EVAL_INLINE = os.getenv("EVAL_INLINE", "false").lower() == "true"
+# EVAL_INLINE일 때 [DONE] 뒤에 평가를 기다리는 최대 시간, 넘으면 [EVAL] 이벤트 없이 끝낸다
+EVAL_INLINE_TIMEOUT = float(os.getenv("EVAL_INLINE_TIMEOUT", "5"))
+
+logger = logging.getLogger(__name__)
+
+
+class EvaluationQueue:
+
+    """
+    TruLens 평가를 요청 경로 밖에서 실행하는 백그라운드 큐
+
+    sample_rate 비율의 답변만 평가하고, 대기 중인 평가가 queue_size개를 넘으면 새 평가는 버린다.
+    결과는 Elasticsearch 인덱스에 저장되고 세션 ID로 조회할 수 있다.
+    """
+
+    def __init__(self, client, index, sample_rate=EVAL_SAMPLE_RATE, max_workers=EVAL_MAX_WORKERS, queue_size=EVAL_QUEUE_SIZE):
+        self.client = client
+        self.index = index
+        self.sample_rate = sample_rate
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="evaluation")
+        self.slots = BoundedSemaphore(queue_size)
+        self.provider = None
+        self.provider_lock = Lock()
+        self.index_ready = False
+
+    def ensure_index(self):
+        if self.index_ready:
+            return
+        if not self.client.indices.exists(index=self.index):
+            self.client.indices.create(
+                index=self.index,
+                mappings={
+                    "properties": {
+                        "session_id": {"type": "keyword"},
+                        "created_at": {"type": "date"},
+                        "question": {"type": "text"},
+                        "context_relevance": {"type": "float"},
+                        "groundedness": {"type": "float"},
+                        "answer_relevance": {"type": "float"},
+                        "context_relevance_reason": {"type": "object", "enabled": False},
+                        "groundedness_reason": {"type": "object", "enabled": False},
+                    }
+                },
+            )
+        self.index_ready = True
+
+    def get_provider(self):
+        with self.provider_lock:
+            if self.provider is None:
+                self.provider = OpenAI(model_engine=EVAL_MODEL)
+            return self.provider
+
+    def submit(self, session_id, question, answer, context):
+
+        """
+        답변 평가를 큐에 넣는다
+
+        Returns:
+            (eval_id, Future), 표본에서 빠졌거나 큐가 가득 차면 None
+        """
+        if random.random() >= self.sample_rate:
+            return None
+        if not self.slots.acquire(blocking=False):
+            logger.warning("Evaluation queue is full, skipping evaluation of session %s", session_id)
+            return None
+        eval_id = str(uuid4())
+        try:
+            return eval_id, self.executor.submit(self._evaluate, eval_id, session_id, question, answer, context)
+        except Exception:
+            # 작업이 실행되지 않으면 _evaluate가 자리를 반납하지 못한다
+            self.slots.release()
+            logger.exception("Failed to queue evaluation of session %s", session_id)
+            return None
+
+    def _evaluate(self, eval_id, session_id, question, answer, context):
+        try:
+            provider = self.get_provider()
+            answer_relevance = provider.relevance(prompt=question, response=answer)
+            context_relevance, context_relevance_reason = provider.context_relevance_with_cot_reasons(question=question, context=context)
+            groundedness, groundedness_reason = provider.groundedness_measure_with_cot_reasons(source=context, statement=answer)
+            document = {
+                "session_id": session_id,
+                "created_at": round(time() * 1000),
+                "question": question,
+                "context_relevance": context_relevance,
+                "groundedness": groundedness,
+                "answer_relevance": answer_relevance,
+                "context_relevance_reason": context_relevance_reason,
+                "groundedness_reason": groundedness_reason,
+            }
+            self.ensure_index()
+            self.client.index(index=self.index, id=eval_id, document=document)
+            return document
+        except Exception:
+            logger.exception("Failed to evaluate answer of session %s", session_id)
+        finally:
+            self.slots.release()
+
+    def results(self, session_id, eval_id=None):
+        self.ensure_index()
+        query = {"term": {"session_id": session_id}}
+        if eval_id is not None:
+            query = {"bool": {"filter": [query, {"ids": {"values": [eval_id]}}]}}
+        result = self.client.search(
+            index=self.index,
+            query=query,
+            sort="created_at:asc",
+            size=100,
+        )
+        return [
+            {"eval_id": document["_id"], **document["_source"]}
+            for document in result["hits"]["hits"]
+        ]
@@ -1,42 +1,22 @@
 from deepeval.metrics import GEval
 from deepeval.test_case import LLMTestCaseParams, LLMTestCase
-from langchain_elasticsearch import ElasticsearchStore
 from llm_integrations import get_llm
 from elasticsearch_client import (
     elasticsearch_client
 )
-from langchain_openai import OpenAIEmbeddings
+from query_embedding import embed_query
+from context_builder import build_context
+from retrieval import search_indexes, RETRIEVAL_SEARCHES
 import json
-import os
 from dotenv import load_dotenv
 
 load_dotenv(override=True)
 
-NEWS_INDEX = "news"
-STOCK_INDEX = "stock"
-REPORT_INDEX = "report"
 INDEX_CHAT_HISTORY = "chat-history"
 SESSION_ID_TAG = "[SESSION_ID]"
 SOURCE_TAG = "[SOURCE]"
 DONE_TAG = "[DONE]"
 
-embedding = OpenAIEmbeddings(openai_api_key=os.getenv("OPENAI_API_KEY"), model="text-embedding-3-small")
-news_store = ElasticsearchStore(
-    es_connection=elasticsearch_client,
-    index_name=NEWS_INDEX,
-    embedding=embedding,
-)
-stock_store = ElasticsearchStore(
-    es_connection=elasticsearch_client,
-    index_name=STOCK_INDEX,
-    embedding=embedding,
-)
-report_store = ElasticsearchStore(
-    es_connection=elasticsearch_client,
-    index_name=REPORT_INDEX,
-    embedding=embedding,
-)
-
 # G-Eval 메트릭 초기화
 correctness_metric = GEval(
     name="Correctness",
@@ -82,10 +62,8 @@ coherence_metric = GEval(
 
 def ask_question_with_geval(question, expected_answer):
     condensed_question = question
-    news = news_store.as_retriever().invoke(condensed_question)
-    stock = stock_store.as_retriever(search_kwargs={'k': 2}).invoke(condensed_question)
-    reports = report_store.as_retriever().invoke(condensed_question)
-    docs = news + stock + reports
+    query_vector = embed_query(condensed_question)
+    docs = build_context(search_indexes(elasticsearch_client, query_vector, RETRIEVAL_SEARCHES))
     source = ""
     for doc in docs:
          doc_source = {**doc.metadata, "page_content": doc.page_content}
@@ -1,5 +1,6 @@
 from langchain_anthropic import ChatAnthropic
 from langchain_openai import ChatOpenAI
+from threading import Lock
 import os
 from dotenv import load_dotenv
 
@@ -7,24 +8,51 @@ load_dotenv(override=True)
 
 LLM_TYPE = os.getenv("LLM_TYPE", "openai")
 
-def init_gpt4o(temperature):
+def init_openai(model, temperature):
     OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
     return ChatOpenAI(
-        model="gpt-4o", openai_api_key=OPENAI_API_KEY, streaming=True, temperature=temperature
+        model=model, openai_api_key=OPENAI_API_KEY, streaming=True, temperature=temperature
     )
 
-def init_claude3(temperature):
+def init_anthropic(model, temperature):
     ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY")
     return ChatAnthropic(
-        model="claude-3-opus-20240229", anthropic_api_key=ANTHROPIC_API_KEY, streaming=True, temperature=temperature
+        model=model, anthropic_api_key=ANTHROPIC_API_KEY, streaming=True, temperature=temperature
     )
 
 MAP_LLM_TYPE_TO_CHAT_MODEL = {
-    "openai": init_gpt4o,
-    "anthropic": init_claude3
+    "openai": init_openai,
+    "anthropic": init_anthropic
 }
 
-def get_llm(temperature=0):
+# 단계별 기본 모델 (LLM_MODEL_<STAGE> 환경 변수로 변경 가능)
+MAP_LLM_TYPE_TO_STAGE_MODEL = {
+    "openai": {
+        "condense": "gpt-4o-mini",
+        "tool": "gpt-4o-mini",
+        "answer": "gpt-4o",
+    },
+    "anthropic": {
+        "condense": "claude-3-haiku-20240307",
+        "tool": "claude-3-haiku-20240307",
+        "answer": "claude-3-opus-20240229",
+    },
+}
+
+llm_clients = {}
+llm_clients_lock = Lock()
+
+def get_model(stage):
+    models = MAP_LLM_TYPE_TO_STAGE_MODEL[LLM_TYPE]
+    if not stage in models:
+        raise Exception(
+            "LLM stage not found. Please use one of: "
+            + ", ".join(models.keys())
+            + "."
+        )
+    return os.getenv(f"LLM_MODEL_{stage.upper()}", models[stage])
+
+def get_llm(temperature=0, stage="answer"):
     if not LLM_TYPE in MAP_LLM_TYPE_TO_CHAT_MODEL:
         raise Exception(
             "LLM type not found. Please set LLM_TYPE to one of: "
@@ -32,4 +60,10 @@ def get_llm(temperature=0):
             + "."
         )
 
-    return MAP_LLM_TYPE_TO_CHAT_MODEL[LLM_TYPE](temperature=temperature)
+    model = get_model(stage)
+    key = (LLM_TYPE, model, temperature)
+    with llm_clients_lock:
+        # 같은 설정의 클라이언트는 재사용해서 HTTP 연결을 유지한다
+        if key not in llm_clients:
+            llm_clients[key] = MAP_LLM_TYPE_TO_CHAT_MODEL[LLM_TYPE](model=model, temperature=temperature)
+        return llm_clients[key]
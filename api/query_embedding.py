@@ -0,0 +1,52 @@
+from langchain_openai import OpenAIEmbeddings
+from cachetools import TTLCache
+from threading import Lock
+import os
+from dotenv import load_dotenv
+
+load_dotenv(override=True)
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "1024"))
+QUERY_EMBEDDING_CACHE_TTL = int(os.getenv("QUERY_EMBEDDING_CACHE_TTL", "3600"))
+
+embedding = OpenAIEmbeddings(openai_api_key=os.getenv("OPENAI_API_KEY"), model=EMBEDDING_MODEL)
+
+query_embedding_cache = TTLCache(maxsize=QUERY_EMBEDDING_CACHE_SIZE, ttl=QUERY_EMBEDDING_CACHE_TTL)
+query_embedding_cache_lock = Lock()
+
+
+def normalize_question(question):
+    return " ".join(question.split()).lower()
+
+
+def get_cached(question):
+    key = (EMBEDDING_MODEL, normalize_question(question))
+    with query_embedding_cache_lock:
+        return key, query_embedding_cache.get(key)
+
+
+def set_cached(key, vector):
+    with query_embedding_cache_lock:
+        query_embedding_cache[key] = vector
+
+
+def embed_query(question):
+    """
+    질문 임베딩을 한 번만 계산해서 모든 인덱스 검색에 공유한다.
+    (정규화된 질문, 모델)을 키로 하는 LRU/TTL 캐시에 있으면 임베딩 API를 호출하지 않는다.
+    정규화는 캐시 키에만 쓰고 임베딩은 원래 질문으로 계산한다.
+    """
+    key, vector = get_cached(question)
+    if vector is None:
+        vector = embedding.embed_query(question)
+        set_cached(key, vector)
+    return vector
+
+
+async def aembed_query(question):
+    key, vector = get_cached(question)
+    if vector is None:
+        vector = await embedding.aembed_query(question)
+        set_cached(key, vector)
+    return vector
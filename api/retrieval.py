@@ -0,0 +1,145 @@
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from langchain_core.documents import Document
+import asyncio
+import logging
+import os
+import time
+from dotenv import load_dotenv
+
+load_dotenv(override=True)
+
+RETRIEVAL_TIMEOUT = float(os.getenv("RETRIEVAL_TIMEOUT", "5"))
+REAL_TIME_TIMEOUT = float(os.getenv("REAL_TIME_TIMEOUT", "3"))
+RETRIEVAL_MAX_WORKERS = int(os.getenv("RETRIEVAL_MAX_WORKERS", "16"))
+
+# ElasticsearchStore가 만드는 인덱스의 필드 이름과 기본 kNN 설정
+TEXT_FIELD = "text"
+VECTOR_FIELD = "vector"
+NUM_CANDIDATES = 50
+
+NEWS_INDEX = "news"
+STOCK_INDEX = "stock"
+REPORT_INDEX = "report"
+
+# 채팅과 G-Eval이 함께 쓰는 인덱스별 검색 설정
+RETRIEVAL_SEARCHES = {
+    "news": {"index": NEWS_INDEX, "k": 4},
+    "stock": {"index": STOCK_INDEX, "k": 2},
+    "reports": {"index": REPORT_INDEX, "k": 4},
+}
+
+logger = logging.getLogger(__name__)
+executor = ThreadPoolExecutor(
+    max_workers=RETRIEVAL_MAX_WORKERS, thread_name_prefix="retrieval"
+)
+
+
+def fetch_concurrently(sources):
+    """
+    독립적인 I/O 작업을 병렬로 실행하고 소스별 제한 시간 안에 끝난 결과만 모은다.
+
+    Args:
+        sources: {이름: (함수, 제한 시간(초), 실패 시 기본값)}
+
+    Returns:
+        {이름: 결과} (시간 초과 또는 예외가 난 소스는 기본값으로 채움)
+    """
+    started_at = time.monotonic()
+    futures = {name: executor.submit(fn) for name, (fn, _, _) in sources.items()}
+    result = dict()
+    for name, future in futures.items():
+        _, timeout, default = sources[name]
+        remaining = max(0, started_at + timeout - time.monotonic())
+        try:
+            result[name] = future.result(timeout=remaining)
+        except TimeoutError:
+            future.cancel()
+            logger.warning("Source %s timed out after %.1fs", name, timeout)
+            result[name] = default
+        except Exception:
+            logger.exception("Source %s failed", name)
+            result[name] = default
+    return result
+
+
+async def afetch_concurrently(sources):
+    """fetch_concurrently의 asyncio 버전 (소스 함수는 코루틴을 돌려줘야 한다)"""
+
+    async def run(name, fn, timeout, default):
+        try:
+            return await asyncio.wait_for(fn(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Source %s timed out after %.1fs", name, timeout)
+        except Exception:
+            logger.exception("Source %s failed", name)
+        return default
+
+    results = await asyncio.gather(
+        *(run(name, fn, timeout, default) for name, (fn, timeout, default) in sources.items())
+    )
+    return dict(zip(sources.keys(), results))
+
+
+def knn_query(query_vector, k=4, filter=None):
+    return {
+        "knn": {
+            "field": VECTOR_FIELD,
+            "query_vector": query_vector,
+            "k": k,
+            "num_candidates": max(NUM_CANDIDATES, k),
+            "filter": filter or [],
+        },
+        "size": k,
+        "_source": [TEXT_FIELD, "metadata"],
+    }
+
+
+def hits_to_docs_scores(hits):
+    return [
+        (
+            Document(
+                page_content=hit["_source"].get(TEXT_FIELD, ""),
+                metadata=hit["_source"].get("metadata", {}),
+            ),
+            hit["_score"],
+        )
+        for hit in hits
+    ]
+
+
+def msearch_body(query_vector, searches):
+    body = []
+    for search in searches.values():
+        body.append({"index": search["index"]})
+        body.append(knn_query(query_vector, k=search.get("k", 4), filter=search.get("filter")))
+    return body
+
+
+def combine_responses(searches, response):
+    result = []
+    for name, item in zip(searches.keys(), response["responses"]):
+        if "error" in item:
+            # 한 인덱스가 실패해도 나머지 인덱스의 결과는 사용한다
+            logger.warning("Search on %s failed: %s", name, item["error"])
+            continue
+        result.extend(hits_to_docs_scores(item["hits"]["hits"]))
+    return result
+
+
+def search_indexes(client, query_vector, searches):
+    """
+    여러 인덱스의 kNN 검색을 한 번의 msearch 요청으로 보낸다.
+
+    Args:
+        searches: {이름: {"index": 인덱스 이름, "k": 검색 개수, "filter": 필터 목록(선택)}}
+
+    Returns:
+        searches 순서대로 합친 (Document, 점수) 목록
+    """
+    response = client.msearch(searches=msearch_body(query_vector, searches))
+    return combine_responses(searches, response)
+
+
+async def asearch_indexes(client, query_vector, searches):
+    response = await client.msearch(searches=msearch_body(query_vector, searches))
+    return combine_responses(searches, response)
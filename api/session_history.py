@@ -0,0 +1,133 @@
+from concurrent.futures import ThreadPoolExecutor
+from cachetools import TTLCache
+from elasticsearch.helpers import bulk
+from langchain_core.messages import (
+    AIMessage,
+    HumanMessage,
+    message_to_dict,
+    messages_from_dict,
+)
+from threading import Lock
+from time import time
+import json
+import logging
+import os
+from dotenv import load_dotenv
+
+load_dotenv(override=True)
+
+CHAT_HISTORY_WINDOW = int(os.getenv("CHAT_HISTORY_WINDOW", "10"))
+CHAT_HISTORY_CACHE_SIZE = int(os.getenv("CHAT_HISTORY_CACHE_SIZE", "1024"))
+CHAT_HISTORY_CACHE_TTL = int(os.getenv("CHAT_HISTORY_CACHE_TTL", "600"))
+
+logger = logging.getLogger(__name__)
+
+
+class SessionHistory:
+
+    """
+    세션별 최근 대화 기록 저장소
+
+    ElasticsearchChatMessageHistory와 같은 문서 형식을 쓰지만 최근 window 턴만 한 번의 검색으로 읽고,
+    세션 ID별로 프로세스 내부 캐시에 보관한다. 한 턴의 질문과 답변은 요청 경로 밖에서 한 번의 bulk 요청으로 저장한다.
+    """
+
+    def __init__(self, client, index, window=CHAT_HISTORY_WINDOW, async_client=None):
+        self.client = client
+        self.async_client = async_client
+        self.index = index
+        self.window = window
+        self.cache = TTLCache(maxsize=CHAT_HISTORY_CACHE_SIZE, ttl=CHAT_HISTORY_CACHE_TTL)
+        self.lock = Lock()
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="chat-history")
+        self.index_ready = False
+
+    def index_mappings(self):
+        return {
+            "properties": {
+                "session_id": {"type": "keyword"},
+                "created_at": {"type": "date"},
+                "history": {"type": "text"},
+            }
+        }
+
+    def ensure_index(self):
+        if self.index_ready:
+            return
+        if not self.client.indices.exists(index=self.index):
+            self.client.indices.create(index=self.index, mappings=self.index_mappings())
+        self.index_ready = True
+
+    async def aensure_index(self):
+        if self.index_ready:
+            return
+        if not await self.async_client.indices.exists(index=self.index):
+            await self.async_client.indices.create(index=self.index, mappings=self.index_mappings())
+        self.index_ready = True
+
+    def search_kwargs(self, session_id):
+        return {
+            "index": self.index,
+            "query": {"term": {"session_id": session_id}},
+            "sort": "created_at:desc",
+            "size": self.window * 2,
+        }
+
+    def cache_result(self, session_id, result):
+        items = [
+            json.loads(document["_source"]["history"])
+            for document in reversed(result["hits"]["hits"])
+        ]
+        messages = messages_from_dict(items)
+        with self.lock:
+            # 조회하는 동안 다른 요청이 먼저 캐시를 채웠다면 그 값을 우선한다
+            messages = self.cache.setdefault(session_id, messages)
+        return list(messages)
+
+    def get_cached(self, session_id):
+        with self.lock:
+            cached = self.cache.get(session_id)
+        return None if cached is None else list(cached)
+
+    def messages(self, session_id):
+        cached = self.get_cached(session_id)
+        if cached is not None:
+            return cached
+
+        self.ensure_index()
+        return self.cache_result(session_id, self.client.search(**self.search_kwargs(session_id)))
+
+    async def amessages(self, session_id):
+        cached = self.get_cached(session_id)
+        if cached is not None:
+            return cached
+
+        await self.aensure_index()
+        return self.cache_result(session_id, await self.async_client.search(**self.search_kwargs(session_id)))
+
+    def add_turn(self, session_id, question, answer):
+        turn = [HumanMessage(content=question), AIMessage(content=answer)]
+        with self.lock:
+            messages = self.cache.get(session_id)
+            if messages is not None:
+                self.cache[session_id] = (messages + turn)[-self.window * 2:]
+        self.writer.submit(self._write, session_id, turn)
+
+    def _write(self, session_id, messages):
+        created_at = round(time() * 1000)
+        actions = [
+            {
+                "_index": self.index,
+                "_source": {
+                    "session_id": session_id,
+                    "created_at": created_at + i,
+                    "history": json.dumps(message_to_dict(message)),
+                },
+            }
+            for i, message in enumerate(messages)
+        ]
+        try:
+            self.ensure_index()
+            bulk(self.client, actions, refresh="wait_for")
+        except Exception:
+            logger.exception("Failed to persist chat history of session %s", session_id)
@@ -5,6 +5,9 @@ from datetime import datetime
 from langchain_community.document_loaders import WebBaseLoader
 import re
 import json
+from itertools import chain
+
+from data.pipeline import stream_to_json
 
 load_dotenv(override=True)
 API_KEY = os.getenv("ALPHA_VANTAGE_API_KEY")
@@ -12,23 +15,34 @@ API_KEY = os.getenv("ALPHA_VANTAGE_API_KEY")
 def fetch_all(start_date, end_date):
     result = get_alpha_vantage_data("NVDA",start_date,end_date) + get_alpha_vantage_data("AMD",start_date,end_date)
     json_result = transform_data(result)
-    start_date_str = convert_date_format(start_date)
-    end_date_str = convert_date_format(end_date)
-    file_name = f'news_{start_date_str}_to_{end_date_str}.json'
-    save_path = os.path.join(os.path.dirname(__file__), 'news', 'alphavantage', file_name)
+    save_path = news_save_path(start_date, end_date)
     os.makedirs(os.path.dirname(save_path), exist_ok=True)
     with open(save_path, 'w') as json_file:
         json.dump(json_result, json_file, ensure_ascii=False, indent=4)
     return result
-    
+
+def iter_all(start_date, end_date):
+    """fetch_all과 같은 데이터를 기사 하나씩 dict로 yield하면서 JSON 파일에 기록"""
+    docs = chain(iter_alpha_vantage_data("NVDA",start_date,end_date), iter_alpha_vantage_data("AMD",start_date,end_date))
+    items = (transform_data([doc])[0] for doc in docs)
+    yield from stream_to_json(items, news_save_path(start_date, end_date))
+
+def news_save_path(start_date, end_date):
+    start_date_str = convert_date_format(start_date)
+    end_date_str = convert_date_format(end_date)
+    file_name = f'news_{start_date_str}_to_{end_date_str}.json'
+    return os.path.join(os.path.dirname(__file__), 'news', 'alphavantage', file_name)
+
 def get_alpha_vantage_data(ticker,start_date, end_date):
+    return list(iter_alpha_vantage_data(ticker, start_date, end_date))
+
+def iter_alpha_vantage_data(ticker,start_date, end_date):
     start_date = convert_to_datetime_format(start_date)
     end_date = convert_to_datetime_format(end_date, end=True)
     url = f'https://www.alphavantage.co/query?function=NEWS_SENTIMENT&tickers={ticker}&apikey={API_KEY}&time_from={start_date}&time_to={end_date}&sort=RELEVANCE'
     resp = requests.get(url)
     data = resp.json()
     data = data['feed']
-    docs = []
 
     for item in data:
         loader = WebBaseLoader(item['url'])
@@ -46,9 +60,7 @@ def get_alpha_vantage_data(ticker,start_date, end_date):
             company = "unknown"
         result[0].metadata['company'] = company
         result[0].page_content = normalize_newlines(result[0].page_content)
-        docs.append(result[0])
-    
-    return docs
+        yield result[0]
 
 def convert_to_datetime_format(date_str, end=False):
     date_obj = datetime.strptime(date_str, "%Y%m%d")
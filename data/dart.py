@@ -3,11 +3,18 @@ import os
 import sys
 import openparse
 import json
+import multiprocessing
+import hashlib
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dart_fss.errors import NoDataReceived
 from dotenv import load_dotenv
 
 basedir = os.path.abspath(os.path.dirname(__file__))
 sys.path.append(os.path.join(basedir, '../'))
 from data.util import convert_date_format
+from data.pipeline import bounded_map
+from data.rate_limiter import RateLimiter
 
 load_dotenv(override=True)
 api_key = os.getenv("DART_API_KEY")
@@ -15,83 +22,201 @@ openai_api_key = os.getenv("OPENAI_API_KEY")
 dart.set_api_key(api_key)
 
 current_dir = os.path.dirname(os.path.abspath(__file__))
-samsung_folder = os.path.join(current_dir,"disclosure", "samsung")
-hynix_folder = os.path.join(current_dir, "disclosure", "hynix")
+disclosure_folder = os.path.join(current_dir, "disclosure")
+DART_PARSE_WORKERS = int(os.getenv("DART_PARSE_WORKERS", "4"))
+DART_PARSED_CACHE_DIR = os.getenv(
+    "DART_PARSED_CACHE_DIR", os.path.join(current_dir, "disclosure", ".parsed")
+)
+DART_REQUESTS_PER_SECOND = float(os.getenv("DART_REQUESTS_PER_SECOND", "5"))
+DART_FETCH_WORKERS = int(os.getenv("DART_FETCH_WORKERS", "4"))
+# 색인 스레드가 돌고 있는 파이프라인 안에서 풀을 만들므로 fork 대신 spawn으로 워커를 띄운다
+spawn_context = multiprocessing.get_context("spawn")
 
-def get_filing_list_samsung(start_date, end_date):
-    samsung = dart.corp.Corp('00126380')
+# 수집 대상 회사: 폴더 이름(data/disclosure/{name}) -> DART 고유번호
+DART_COMPANIES = {
+    "samsung": "00126380",
+    "hynix": "00164779",
+}
+
+rate_limiter = RateLimiter(DART_REQUESTS_PER_SECOND)
+page_executor = ThreadPoolExecutor(max_workers=DART_FETCH_WORKERS)
+
+
+def search_page(corp_code, start_date, end_date, page_no):
+    rate_limiter.acquire()
+    return dart.filings.search(
+        corp_code=corp_code, bgn_de=start_date, end_de=end_date, sort='date',
+        pblntf_ty=["A","B"], page_no=page_no, page_count=100,
+    )
+
+def search_reports(corp_code, start_date, end_date):
+
+    """
+    기간 내 정기·주요사항 보고서 목록
+
+    첫 페이지 응답을 그대로 쓰고 나머지 페이지는 동시에 요청하며, 접수번호로 중복을 제거한다.
+    조회 결과가 없으면 빈 목록을 돌려주고 그 밖의 오류는 그대로 올린다.
+    """
     try:
-        result = []
-        samsung_reports = samsung.search_filings(bgn_de=start_date, end_de=end_date, sort='date', pblntf_ty=["A","B"], page_count=100)
-        pages = samsung_reports.total_page
-        for page in range(1, pages+1):
-            samsung_reports = samsung.search_filings(bgn_de=start_date, end_de=end_date, sort='date', pblntf_ty=["A","B"], page_no=page, page_count=100).report_list
-            for report in samsung_reports:
-                result.extend(process_report(samsung_folder, report))
-        return result
-    except:
-        print("Samsung reports not found")
+        first_page = search_page(corp_code, start_date, end_date, 1)
+    except NoDataReceived:
         return []
+    pages = [first_page] + list(page_executor.map(
+        lambda page_no: search_page(corp_code, start_date, end_date, page_no),
+        range(2, first_page.total_page + 1),
+    ))
+    reports = dict()
+    for page in pages:
+        for report in page.report_list:
+            reports.setdefault(report.rcp_no, report)
+    return list(reports.values())
+
+def iter_filings(start_date, end_date, companies=None):
+
+    """
+    DART_COMPANIES(또는 companies에 지정한 회사)의 공시를 파싱한 청크 dict를 yield
+
+    회사별 목록 조회는 동시에 진행하고, 내려받기와 파싱은 모든 회사의 공시를 하나의 흐름으로 처리한다.
+    """
+    companies = list(DART_COMPANIES) if companies is None else companies
+    with ThreadPoolExecutor(max_workers=len(companies) or 1) as executor:
+        searches = {
+            name: executor.submit(search_reports, DART_COMPANIES[name], start_date, end_date)
+            for name in companies
+        }
+        reports = []
+        for name, future in searches.items():
+            try:
+                company_reports = future.result()
+            except Exception as e:
+                raise RuntimeError(f"DART filing search failed for {name}") from e
+            print(f"Found {len(company_reports)} {name} reports")
+            reports.extend((os.path.join(disclosure_folder, name), report) for report in company_reports)
+    yield from process_reports(reports)
+
+def get_filing_list_samsung(start_date, end_date):
+    return list(iter_filing_list_samsung(start_date, end_date))
+
+def iter_filing_list_samsung(start_date, end_date):
+    return iter_filings(start_date, end_date, ["samsung"])
 
 def get_filing_list_hynix(start_date, end_date):
-    hynix = dart.corp.Corp('00164779')
-    try: 
-        result = []
-        hynix_reports = hynix.search_filings(bgn_de=start_date, end_de=end_date, sort='date', pblntf_ty=["A","B"], page_count=100)
-        page_hynix =  hynix_reports.total_page
-        for page in range(1, page_hynix+1):
-            hynix_reports = hynix.search_filings(bgn_de=start_date, end_de=end_date, sort='date', pblntf_ty=["A","B"], page_no=page, page_count=100).report_list
-            for report in hynix_reports:
-                result.extend(process_report(hynix_folder, report))
-        return result
-    except:
-        print("Hynix reports not found")
-        return []
+    return list(iter_filing_list_hynix(start_date, end_date))
 
+def iter_filing_list_hynix(start_date, end_date):
+    return iter_filings(start_date, end_date, ["hynix"])
 
-def process_report(folder_path, report):
-    result = []
-    os.makedirs(os.path.dirname(folder_path), exist_ok=True)
-    report.attached_files[0].download(folder_path)
-    file_name = report.attached_files[0].filename
-    report_path = os.path.join(folder_path, file_name)
-    report_name = os.path.splitext(file_name)[0]
-    report_date = convert_date_format(report.rcept_dt)
-    report_url = "https://dart.fss.or.kr/dsaf001/main.do?rcpNo="+str(report.rcp_no)
-    company_name = report.corp_name
-    report_content = parse_report(report_path)
-    for content in report_content:
-        result.append({
-            "company": company_name,
-            "name": report_name,
-            "url": report_url,
-            "content": content,
-            "updated_at": report_date,
-            "category": "dart"
-        })
-    file_name = f'{report_name}.json'
-    save_path = os.path.join(folder_path, file_name)
-    with open(save_path, 'w') as json_file:
-        json.dump(result, json_file, ensure_ascii=False, indent=4)
-    return result
-    
 
-def parse_report(report_path):
-    result = []
+def download_report(folder_path, report):
+    rate_limiter.acquire()
+    attached_file = report.attached_files[0]
+    file_name = attached_file.filename
+    # 이미 받아 둔 PDF는 다시 내려받지 않는다
+    if not os.path.exists(os.path.join(folder_path, file_name)):
+        rate_limiter.acquire()
+        attached_file.download(folder_path)
+    return {
+        "company": report.corp_name,
+        "name": os.path.splitext(file_name)[0],
+        "path": os.path.join(folder_path, file_name),
+        "url": "https://dart.fss.or.kr/dsaf001/main.do?rcpNo="+str(report.rcp_no),
+        "updated_at": convert_date_format(report.rcept_dt),
+    }
+
+def process_reports(reports):
+
+    """
+    (저장 폴더, 공시) 목록의 PDF를 동시에 내려받고 프로세스 풀에서 파싱해 청크 dict를 공시 순서대로 yield
+    """
+    for folder_path in set(folder_path for folder_path, _ in reports):
+        os.makedirs(folder_path, exist_ok=True)
+    with ThreadPoolExecutor(max_workers=DART_FETCH_WORKERS) as downloader, \
+            ProcessPoolExecutor(max_workers=DART_PARSE_WORKERS, initializer=init_parse_worker, mp_context=spawn_context) as parser:
+        entries = bounded_map(downloader, lambda item: download_report(*item), reports, DART_FETCH_WORKERS * 2)
+        for entry, report_content in bounded_map(parser, parse_filing, entries, DART_PARSE_WORKERS * 2):
+            result = [
+                {
+                    "company": entry["company"],
+                    "name": entry["name"],
+                    "url": entry["url"],
+                    "content": content,
+                    "updated_at": entry["updated_at"],
+                    "category": "dart"
+                }
+                for content in report_content
+            ]
+            save_path = os.path.join(os.path.dirname(entry["path"]), f'{entry["name"]}.json')
+            with open(save_path, 'w') as json_file:
+                json.dump(result, json_file, ensure_ascii=False, indent=4)
+            yield from result
+
+# 파싱 워커 프로세스마다 한 번만 만드는 파서
+_parser = None
+
+def init_parse_worker():
+    global _parser
     semantic_pipeline = openparse.processing.SemanticIngestionPipeline(
         openai_api_key=openai_api_key,
         model="text-embedding-3-small",
         min_tokens=64,
         max_tokens=1024,
     )
-    parser = openparse.DocumentParser(
+    _parser = openparse.DocumentParser(
         processing_pipeline=semantic_pipeline,
         table_args={
             "parsing_algorithm": "pymupdf",
             "table_output_format": "markdown"
         }
     )
-    parsed_report = parser.parse(report_path)
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def load_parsed_json(entry):
+
+    """
+    예전 실행이 PDF 옆에 남긴 {report_name}.json에서 파싱 결과를 읽는다 (없으면 None)
+
+    해시 캐시가 생기기 전에 파싱해 둔 data/disclosure/{samsung,hynix}의 결과를 그대로 재사용하기 위한 것이다.
+    """
+    parsed_path = os.path.splitext(entry["path"])[0] + ".json"
+    if not os.path.exists(parsed_path):
+        return None
+    with open(parsed_path, "r") as f:
+        return [item["content"] for item in json.load(f)]
+
+def parse_filing(entry):
+
+    """
+    PDF 내용 해시로 파싱 결과를 캐시해서 같은 PDF는 다시 파싱(임베딩 API 호출 포함)하지 않는다.
+    """
+    cache_path = os.path.join(DART_PARSED_CACHE_DIR, file_hash(entry["path"]) + ".json")
+    if os.path.exists(cache_path):
+        with open(cache_path, "r") as f:
+            return entry, json.load(f)
+
+    report_content = load_parsed_json(entry)
+    if report_content is None:
+        started_at = time.perf_counter()
+        report_content = parse_report(entry["path"])
+        print(f"Parsed {entry['name']} into {len(report_content)} chunks in {time.perf_counter() - started_at:.1f}s")
+
+    os.makedirs(DART_PARSED_CACHE_DIR, exist_ok=True)
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(report_content, f, ensure_ascii=False)
+    os.replace(tmp_path, cache_path)
+    return entry, report_content
+
+def parse_report(report_path):
+    if _parser is None:
+        init_parse_worker()
+    result = []
+    parsed_report = _parser.parse(report_path)
     for node in parsed_report.nodes:
         elem = node.text.replace("<br>", "")
         result.append(elem)
@@ -100,5 +225,4 @@ def parse_report(report_path):
 if __name__ == "__main__":
     start_date = '20240501'
     end_date = '20240616'
-    get_filing_list_samsung(start_date, end_date)
-    get_filing_list_hynix(start_date, end_date)
\ No newline at end of file
+    list(iter_filings(start_date, end_date))
\ No newline at end of file
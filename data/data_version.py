@@ -0,0 +1,27 @@
+import os
+import time
+
+DATA_VERSION_PATH = os.getenv(
+    "DATA_VERSION_PATH", os.path.join(os.path.dirname(__file__), ".data_version")
+)
+
+
+def get_data_version() -> int:
+
+    """
+    인덱스 데이터 버전 조회 (index_data.add_* 로 새 문서가 색인될 때마다 바뀜)
+    """
+    try:
+        with open(DATA_VERSION_PATH) as f:
+            return int(f.read().strip() or 0)
+    except FileNotFoundError:
+        return 0
+
+
+def bump_data_version() -> int:
+    version = time.time_ns()
+    tmp_path = f"{DATA_VERSION_PATH}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(str(version))
+    os.replace(tmp_path, DATA_VERSION_PATH)
+    return version
@@ -1,9 +1,12 @@
 import json
+import multiprocessing
 import numpy as np
 import pandas as pd
 import requests
 import os
 import warnings
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime
 import re
 from io import StringIO
@@ -11,6 +14,15 @@ import bs4
 import pandas as pd
 import sec_parser as sp
 import tiktoken
+import time
+import random
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+
+from data.rate_limiter import RateLimiter
+from data.pipeline import bounded_map
+
+load_dotenv(override=True)
 
 current_dir = os.path.dirname(os.path.abspath(__file__))
 amd_folder = os.path.join(current_dir,"disclosure", "amd")
@@ -21,12 +33,54 @@ nvda_cik = "1045810"
 
 amd_url = f"https://data.sec.gov/submissions/CIK{amd_cik.zfill(10)}.json"
 nvda_url = f"https://data.sec.gov/submissions/CIK{nvda_cik.zfill(10)}.json"
-header = { "User-Agent": "Mozilla"}
+# SEC fair access 정책: 초당 10회 이하, 회사명과 연락처 이메일이 들어간 User-Agent
+SEC_USER_AGENT = os.getenv("SEC_USER_AGENT")
+EDGAR_REQUESTS_PER_SECOND = min(float(os.getenv("EDGAR_REQUESTS_PER_SECOND", "8")), 10)
+EDGAR_MAX_RETRIES = 3
+EDGAR_RETRY_STATUS = {429, 500, 502, 503, 504}
+EDGAR_DOWNLOAD_WORKERS = int(os.getenv("EDGAR_DOWNLOAD_WORKERS", "8"))
+EDGAR_PARSE_WORKERS = int(os.getenv("EDGAR_PARSE_WORKERS", str(os.cpu_count() or 1)))
+# 색인 스레드가 돌고 있는 파이프라인 안에서 풀을 만들므로 fork 대신 spawn으로 워커를 띄운다
+spawn_context = multiprocessing.get_context("spawn")
+
+# 처음부터 몰아서 보내지 않도록 burst 없이 일정한 간격으로 요청한다
+rate_limiter = RateLimiter(EDGAR_REQUESTS_PER_SECOND, burst=1)
+
+
+def create_session():
+    session = requests.Session()
+    # 재시도도 rate_limiter를 거치도록 urllib3 재시도는 쓰지 않고 sec_get에서 직접 재시도한다
+    adapter = HTTPAdapter(pool_connections=EDGAR_DOWNLOAD_WORKERS, pool_maxsize=EDGAR_DOWNLOAD_WORKERS, max_retries=0)
+    session.mount("https://", adapter)
+    session.headers.update({"Accept-Encoding": "gzip, deflate"})
+    return session
+
+session = create_session()
+
+
+def sec_get(url):
+    if not SEC_USER_AGENT:
+        raise ValueError(
+            "Please set SEC_USER_AGENT to your company name and contact email (e.g. \"your-company admin@your-company.com\")"
+        )
+    for attempt in range(EDGAR_MAX_RETRIES + 1):
+        rate_limiter.acquire()
+        response = session.get(url, headers={"User-Agent": SEC_USER_AGENT})
+        if response.status_code not in EDGAR_RETRY_STATUS or attempt == EDGAR_MAX_RETRIES:
+            break
+        delay = 2 ** attempt * (1 + random.random())
+        print(f"SEC returned {response.status_code}, retrying in {delay:.1f}s ({attempt + 1}/{EDGAR_MAX_RETRIES})")
+        time.sleep(delay)
+    response.raise_for_status()
+    return response
 
 def get_filing_list_nvda(start_date, end_date):
+    return list(iter_filing_list_nvda(start_date, end_date))
+
+def iter_filing_list_nvda(start_date, end_date):
     start_date = pd.to_datetime(start_date, format='%Y%m%d')
     end_date = pd.to_datetime(end_date, format='%Y%m%d')
-    nvda_filings = requests.get(nvda_url, headers=header).json()
+    nvda_filings = sec_get(nvda_url).json()
     nvda_filings_df = pd.DataFrame(nvda_filings["filings"]["recent"])
     nvda_filings_df['filingDate'] = pd.to_datetime(nvda_filings_df['filingDate'])
     nvda_selected = nvda_filings_df[
@@ -35,14 +89,16 @@ def get_filing_list_nvda(start_date, end_date):
     ]
     if nvda_selected.empty:
         print("No NVIDIA reports found")
-        return []
     else:
-        return process_report(nvda_folder, nvda_selected, "NVIDIA", nvda_cik)
+        yield from process_report(nvda_folder, nvda_selected, "NVIDIA", nvda_cik)
 
 def get_filing_list_amd(start_date, end_date):
+    return list(iter_filing_list_amd(start_date, end_date))
+
+def iter_filing_list_amd(start_date, end_date):
     start_date = pd.to_datetime(start_date, format='%Y%m%d')
     end_date = pd.to_datetime(end_date, format='%Y%m%d')
-    amd_filings = requests.get(amd_url, headers=header).json()
+    amd_filings = sec_get(amd_url).json()
     amd_filings_df = pd.DataFrame(amd_filings["filings"]["recent"])
     amd_filings_df['filingDate'] = pd.to_datetime(amd_filings_df['filingDate'])
     amd_selected = amd_filings_df[
@@ -51,65 +107,126 @@ def get_filing_list_amd(start_date, end_date):
     ]
     if amd_selected.empty:
         print("No AMD reports found")
-        return []
     else:
-        return process_report(amd_folder, amd_selected, "AMD", amd_cik)
+        yield from process_report(amd_folder, amd_selected, "AMD", amd_cik)
 
 
-def process_report(folder_path, df, company_name, cik):
-    final_result = []
-    os.makedirs(folder_path, exist_ok=True)
+def filing_entries(df, company_name, cik):
+    entries = []
     for index, row in df[df["form"].isin(["10-K", "8-K", "10-Q"])].iterrows():
-        result = []
         access_number = row["accessionNumber"].replace("-", "")
         file_name = row["primaryDocument"]
         report_date = convert_date_format(row["filingDate"])
-        report_name = "["+company_name+"]" + row["form"] + "("+report_date+")"
-        report_url = f"https://www.sec.gov/Archives/edgar/data/{cik}/{access_number}/{file_name}"
-        req_content = requests.get(report_url, headers=header).content.decode("utf-8", errors="ignore")
-        file_path = os.path.join(folder_path, report_name+".html")
-        with open(file_path, "w") as f:
-            f.write(req_content)
-        report_content = parse_report(req_content)
-        for content in report_content:
-            result.append({
-                "company": company_name,
-                "name": report_name,
-                "url": report_url,
-                "content": content,
-                "updated_at": report_date,
-                "category": "edgar"
-            })
-            parsed_file_name = f'{report_name}.json'
-            save_path = os.path.join(folder_path, parsed_file_name)
+        entries.append({
+            "accession": access_number,
+            "name": "["+company_name+"]" + row["form"] + "("+report_date+")",
+            "url": f"https://www.sec.gov/Archives/edgar/data/{cik}/{access_number}/{file_name}",
+            "updated_at": report_date,
+        })
+    # 예전에는 원문을 {report_name}.html로 저장했는데, 이름이 겹치는 공시는 어느 것의 원문인지 알 수 없다
+    name_counts = Counter(entry["name"] for entry in entries)
+    for entry in entries:
+        entry["legacy_name"] = name_counts[entry["name"]] == 1
+    return entries
+
+def download_filing(folder_path, entry):
+
+    """
+    공시 원문 HTML을 로컬 캐시에서 읽고, 없을 때만 SEC에서 내려받아 {accession}.html로 저장
+
+    같은 날짜에 같은 양식의 공시가 여러 개 있어도 겹치지 않도록 접수번호만 키로 쓴다.
+    예전 실행이 남긴 {report_name}.html이 있으면 다시 받지 않고 접수번호 이름으로 옮겨 쓴다.
+    """
+    file_path = os.path.join(folder_path, entry["accession"] + ".html")
+    legacy_path = os.path.join(folder_path, entry["name"] + ".html")
+    if not os.path.exists(file_path) and entry["legacy_name"] and os.path.exists(legacy_path):
+        os.replace(legacy_path, file_path)
+    if os.path.exists(file_path):
+        with open(file_path, "r") as f:
+            return f.read()
+
+    req_content = sec_get(entry["url"]).content.decode("utf-8", errors="ignore")
+    with open(file_path, "w") as f:
+        f.write(req_content)
+    return req_content
+
+def process_report(folder_path, df, company_name, cik):
+
+    """
+    공시 원문을 스레드 풀에서 내려받고 프로세스 풀에서 파싱해 청크 dict를 공시 순서대로 yield
+
+    파싱 결과는 공시마다 {report_name}.json으로 한 번만 기록한다.
+    """
+    os.makedirs(folder_path, exist_ok=True)
+    entries = filing_entries(df, company_name, cik)
+    with ThreadPoolExecutor(max_workers=EDGAR_DOWNLOAD_WORKERS) as downloader, \
+            ProcessPoolExecutor(max_workers=EDGAR_PARSE_WORKERS, initializer=init_parse_worker, mp_context=spawn_context) as parser:
+        download = lambda entry: (entry, download_filing(folder_path, entry))
+        downloaded = bounded_map(downloader, download, entries, EDGAR_DOWNLOAD_WORKERS * 2)
+        for entry, report_content, elapsed in bounded_map(parser, parse_filing, downloaded, EDGAR_PARSE_WORKERS * 2):
+            report_name = entry["name"]
+            print(f"Parsed {report_name} into {len(report_content)} chunks in {elapsed:.1f}s")
+            result = [
+                {
+                    "company": company_name,
+                    "name": report_name,
+                    "url": entry["url"],
+                    "content": content,
+                    "updated_at": entry["updated_at"],
+                    "category": "edgar"
+                }
+                for content in report_content
+            ]
+            save_path = os.path.join(folder_path, f'{report_name}.json')
             with open(save_path, 'w') as json_file:
                 json.dump(result, json_file, ensure_ascii=False, indent=4)
-        final_result.extend(result)
-    return final_result
-    
+            yield from result
+
+# 파싱 워커 프로세스마다 한 번만 만드는 파서와 토크나이저
+_parser = None
+_encoding = None
+
+def init_parse_worker():
+    global _parser, _encoding
+    _parser = sp.Edgar10QParser()
+    _encoding = tiktoken.encoding_for_model("text-embedding-3-small")
+
+def get_encoding():
+    if _encoding is None:
+        init_parse_worker()
+    return _encoding
+
+def parse_filing(downloaded):
+    entry, report = downloaded
+    started_at = time.perf_counter()
+    report_content = parse_report(report)
+    return entry, report_content, time.perf_counter() - started_at
+
 def parse_report(report):
-    parser = sp.Edgar10QParser()
+    if _parser is None:
+        init_parse_worker()
 
     with warnings.catch_warnings():
         warnings.filterwarnings("ignore", message="Invalid section type for")
-        elements: list = parser.parse(report)
+        elements: list = _parser.parse(report)
         return _parse(elements)
 
 def _parse(elements):
-    enc = tiktoken.encoding_for_model("text-embedding-3-small")
+    enc = get_encoding()
     output = []
     i = 0
     while i < len(elements):
         element = elements[i]
-        tokens = enc.encode(element.text)
         if isinstance(element, sp.TextElement):
             if (i + 1 < len(elements)) and isinstance(elements[i + 1], sp.TableElement):
                 combined_text = f"{element.text}\n{_pandas_to_markdown(_html_to_pandas(_unmerge_cells(elements[i + 1].get_source_code())))}"
                 output.append(combined_text)
                 i += 1  
             else:
+                # 토큰 수는 청크를 나눌지 정할 때만 필요하다
+                tokens = enc.encode(element.text)
                 if len(tokens) > 512:
-                    text_chunks = chunk_string(element.text)
+                    text_chunks = chunk_tokens(tokens)
                     output.extend(text_chunks)
                 else:
                     output.append(f"{element.text}")
@@ -153,8 +270,10 @@ def convert_date_format(date_str):
     return formatted_date_str
 
 def chunk_string(string, max_tokens=512, overlap=256):
-    enc = tiktoken.encoding_for_model("text-embedding-3-small")
-    tokens = enc.encode(string)
+    return chunk_tokens(get_encoding().encode(string), max_tokens, overlap)
+
+def chunk_tokens(tokens, max_tokens=512, overlap=256):
+    enc = get_encoding()
     chunks = []
     i = 0
     while i < len(tokens):
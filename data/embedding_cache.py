@@ -0,0 +1,84 @@
+from langchain_core.embeddings import Embeddings
+import hashlib
+import numpy as np
+import os
+import sqlite3
+import threading
+from dotenv import load_dotenv
+
+load_dotenv(override=True)
+
+EMBEDDING_CACHE_PATH = os.getenv(
+    "EMBEDDING_CACHE_PATH", os.path.join(os.path.dirname(__file__), ".embedding_cache.sqlite")
+)
+SQLITE_BATCH_SIZE = 500
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+
+    """
+    (모델, 텍스트 해시)를 키로 임베딩 벡터를 저장하는 로컬 SQLite 캐시
+    """
+
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "model TEXT NOT NULL, text_hash TEXT NOT NULL, vector BLOB NOT NULL, "
+                "PRIMARY KEY (model, text_hash)) WITHOUT ROWID"
+            )
+
+    def get_many(self, model: str, hashes: list[str]) -> dict[str, list[float]]:
+        result = dict()
+        with self.lock:
+            for i in range(0, len(hashes), SQLITE_BATCH_SIZE):
+                batch = hashes[i:i + SQLITE_BATCH_SIZE]
+                rows = self.connection.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({','.join('?' * len(batch))})",
+                    [model, *batch],
+                )
+                for key, vector in rows:
+                    result[key] = np.frombuffer(vector, dtype=np.float32).tolist()
+        return result
+
+    def put_many(self, model: str, vectors: dict[str, list[float]]):
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector) VALUES (?, ?, ?)",
+                [(model, key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in vectors.items()],
+            )
+
+
+class CachedEmbeddings(Embeddings):
+
+    """
+    EmbeddingCache에 없는 텍스트만 실제 임베딩 모델로 계산하는 Embeddings 래퍼
+    """
+
+    def __init__(self, embedding: Embeddings, model: str, cache: EmbeddingCache = None):
+        self.embedding = embedding
+        self.model = model
+        self.cache = cache or EmbeddingCache()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        hashes = [text_hash(text) for text in texts]
+        vectors = self.cache.get_many(self.model, list(set(hashes)))
+        missing = {key: text for key, text in zip(hashes, texts) if key not in vectors}
+        print(f"Embedding cache: {len(vectors)} hits, {len(missing)} misses")
+        if missing:
+            new_vectors = dict(zip(missing.keys(), self.embedding.embed_documents(list(missing.values()))))
+            self.cache.put_many(self.model, new_vectors)
+            vectors.update(new_vectors)
+        return [vectors[key] for key in hashes]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embedding.embed_query(text)
@@ -1,17 +1,23 @@
 from elasticsearch import Elasticsearch, NotFoundError
-from langchain_elasticsearch import ElasticsearchStore
 from langchain.docstore.document import Document
 from langchain_openai import OpenAIEmbeddings
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from dotenv import load_dotenv
+from itertools import chain
 import json
 import os
+import pandas as pd
 
-from data.naver_news import get_news_naver
+from data.naver_news import iter_news_naver, news_save_path
 from data.korea_investment import fetch_all_company_data
-from data.dart import get_filing_list_samsung, get_filing_list_hynix
-from data.edgar import get_filing_list_nvda, get_filing_list_amd
-from data.alpha_vantage import fetch_all
+from data.stock_documents import ROLLUP_PERIODS, STOCK_DAILY_DOCUMENTS, daily_documents, lookback_start, rollup_documents
+from data.dart import iter_filings as iter_dart_filings
+from data.edgar import iter_filing_list_nvda, iter_filing_list_amd
+from data.alpha_vantage import iter_all
+from data.pipeline import run_pipeline, stream_to_json
+from data.data_version import bump_data_version
+from data.indexing import document_source, index_documents
+from data.embedding_cache import CachedEmbeddings
 
 load_dotenv(override=True)
 
@@ -29,130 +35,101 @@ else:
     raise ValueError(
         "Please provide either ELASTICSEARCH_URL or ELASTIC_CLOUD_ID and ELASTIC_API_KEY"
     )
-embedding = OpenAIEmbeddings(openai_api_key=os.getenv("OPENAI_API_KEY"), model="text-embedding-3-small")
+EMBEDDING_MODEL = "text-embedding-3-small"
+embedding = CachedEmbeddings(
+    OpenAIEmbeddings(openai_api_key=os.getenv("OPENAI_API_KEY"), model=EMBEDDING_MODEL),
+    EMBEDDING_MODEL,
+)
 
 
-def add_naver_news_data(day_before=1, length=50):
-    print(f"Loading data from news")
-    responses = get_news_naver(length = length, day_before = day_before)
-    metadata_keys = ["name", "url", "category", "updated_at"]
-    workplace_docs = []
-    for item in responses:
-        workplace_docs.append(
-            Document(
-                page_content=item["content"],
-                metadata={k: item.get(k) for k in metadata_keys},
-            )
-        )
+METADATA_KEYS = ["name", "url", "category", "updated_at"]
 
-    print(f"Loaded {len(workplace_docs)} documents")
 
-    text_splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
-        model_name="text-embedding-3-small", chunk_size=512, chunk_overlap=256
+def item_to_documents(item):
+    return [Document(page_content=item["content"], metadata={k: item.get(k) for k in METADATA_KEYS})]
+
+
+def news_splitter():
+    return RecursiveCharacterTextSplitter.from_tiktoken_encoder(
+        model_name="text-embedding-3-small", chunk_size=512, chunk_overlap=256, add_start_index=True
     )
 
-    docs = text_splitter.transform_documents(workplace_docs)
-    print(f"Split {len(workplace_docs)} documents into {len(docs)} chunks")
-    
-    ElasticsearchStore.from_documents(
-        documents=docs,
-        es_connection=elasticsearch_client,
-        index_name=NEWS_INDEX,
-        embedding=embedding,
+
+def index_stream(items, index_name, splitter=None):
+    indexed = run_pipeline(
+        items,
+        item_to_documents,
+        lambda batch: len(index_documents(elasticsearch_client, index_name, embedding, batch)),
+        splitter=splitter,
+        group_key=document_source,
     )
+    if indexed:
+        bump_data_version()
+    return indexed
+
+
+def add_naver_news_data(day_before=1, length=50):
+    print(f"Loading data from news")
+    items = stream_to_json(iter_news_naver(length=length, day_before=day_before), news_save_path(day_before))
+    index_stream(items, NEWS_INDEX, splitter=news_splitter())
+
+def delete_daily_stock_documents() -> int:
+
+    """
+    주가 색인에 남아 있는 일별 주가 문서(이름이 "... 주가 정보"이지만 주간·월간 요약이 아닌 문서)를 삭제
+
+    Returns:
+        삭제한 문서 수
+    """
+    try:
+        response = elasticsearch_client.delete_by_query(
+            index=STOCK_INDEX,
+            query={
+                "bool": {
+                    "filter": [{"wildcard": {"metadata.name.keyword": "* 주가 정보"}}],
+                    "must_not": [
+                        {"wildcard": {"metadata.name.keyword": f"* {label} 주가 정보"}}
+                        for _, label, _, _ in ROLLUP_PERIODS.values()
+                    ],
+                }
+            },
+            refresh=True,
+            conflicts="proceed",
+        )
+    except NotFoundError:
+        return 0
+    if response["deleted"]:
+        print(f"Deleted {response['deleted']} daily stock documents from {STOCK_INDEX}")
+    return response["deleted"]
 
 def add_stock_data(start_date, end_date):
     print(f"Loading data from stock")
-    df = fetch_all_company_data(start_date, end_date)
-    workplace_docs = []
-    for index, row in df.iterrows():
-        row_str = ', '.join([f"{col} : {row[col]}" for col in df.columns])
-        workplace_docs.append(
-            Document(
-                page_content=row_str,
-                metadata={
-                    "name": row['날짜']+ " " + row['회사명'] +" 주가 정보",
-                    "category": "stock",
-                    "updated_at": row['날짜']
-                },
-            )
-        )
+    # 기간 등락률과 거래량 비교에 필요한 이전 기간까지 함께 읽는다
+    df = fetch_all_company_data(lookback_start(start_date), end_date)
+    workplace_docs = rollup_documents(df, start_date, end_date)
+    has_rollups = bool(workplace_docs)
+    if STOCK_DAILY_DOCUMENTS:
+        workplace_docs.extend(daily_documents(df[df['날짜'] >= pd.Timestamp(start_date)]))
 
     print(f"Loaded {len(workplace_docs)} documents")
-    ElasticsearchStore.from_documents(
-        documents=workplace_docs,
-        es_connection=elasticsearch_client,
-        index_name=STOCK_INDEX,
-        embedding=embedding,
-    )
+    indexed = index_documents(elasticsearch_client, STOCK_INDEX, embedding, workplace_docs)
+    # 일별 문서를 더 만들지 않으면 이전에 색인해 둔 일별 문서도 검색되지 않도록 지운다
+    # (요약 문서를 하나도 만들지 못한 실행에서는 지우지 않는다)
+    deleted = 0 if STOCK_DAILY_DOCUMENTS or not has_rollups else delete_daily_stock_documents()
+    if indexed or deleted:
+        bump_data_version()
 
 def add_dart_data(start_date, end_date):
     print(f"Loading data from dart")
-    result1 = get_filing_list_samsung(start_date, end_date)
-    result2 = get_filing_list_hynix(start_date, end_date)
-    result1.extend(result2)
-    if len(result1)==0:
-        print("No data found")
-        return None
-    else:
-        metadata_keys = ["name", "url", "category", "updated_at"]
-        workplace_docs = []
-        for item in result1:
-            workplace_docs.append(
-                Document(
-                    page_content=item["content"],
-                    metadata={k: item.get(k) for k in metadata_keys},
-                )
-            )
-        print(f"Loaded {len(workplace_docs)} documents")
-        ElasticsearchStore.from_documents(
-            documents=workplace_docs,
-            es_connection=elasticsearch_client,
-            index_name=REPORT_INDEX,
-            embedding=embedding,
-        )
+    items = iter_dart_filings(start_date, end_date)
+    index_stream(items, REPORT_INDEX)
 
 
 def add_edgar_data(start_date, end_date):
     print(f"Loading data from edgar")
-    result1 = get_filing_list_nvda(start_date, end_date)
-    result2 = get_filing_list_amd(start_date, end_date)
-    result1.extend(result2)
-    if len(result1)==0:
-        print("No data found")
-        return None
-    else:
-        metadata_keys = ["name", "url", "category", "updated_at"]
-        workplace_docs = []
-        for item in result1:
-            workplace_docs.append(
-                Document(
-                    page_content=item["content"],
-                    metadata={k: item.get(k) for k in metadata_keys},
-                )
-            )
-        print(f"Loaded {len(workplace_docs)} documents")
-        ElasticsearchStore.from_documents(
-            documents=workplace_docs,
-            es_connection=elasticsearch_client,
-            index_name=REPORT_INDEX,
-            embedding=embedding,
-        )
+    items = chain(iter_filing_list_nvda(start_date, end_date), iter_filing_list_amd(start_date, end_date))
+    index_stream(items, REPORT_INDEX)
 
-    def add_alphavantage_data(start_date, end_date):
-        print(f"Loading data from news")
-        result = fetch_all(start_date, end_date)
-        print(f"Loaded {len(result)} documents")
-
-        text_splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
-            model_name="text-embedding-3-small", chunk_size=512, chunk_overlap=256
-        )
-        docs = text_splitter.transform_documents(result)
-        print(f"Split {len(result)} documents into {len(docs)} chunks")
-        
-        ElasticsearchStore.from_documents(
-            documents=docs,
-            es_connection=elasticsearch_client,
-            index_name=NEWS_INDEX,
-            embedding=embedding,
-        )
\ No newline at end of file
+def add_alphavantage_data(start_date, end_date):
+    print(f"Loading data from alphavantage")
+    index_stream(iter_all(start_date, end_date), NEWS_INDEX, splitter=news_splitter())
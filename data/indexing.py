@@ -0,0 +1,200 @@
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from elasticsearch import NotFoundError
+from elasticsearch.helpers import BulkIndexError
+from langchain_elasticsearch import ElasticsearchStore
+from dotenv import load_dotenv
+import hashlib
+import os
+import random
+import tiktoken
+import time
+
+load_dotenv(override=True)
+
+MGET_BATCH_SIZE = 1000
+DELETE_BATCH_SIZE = 1000
+INDEX_BATCH_SIZE = int(os.getenv("INDEX_BATCH_SIZE", "256"))
+INDEX_CONCURRENCY = int(os.getenv("INDEX_CONCURRENCY", "4"))
+INDEX_MAX_RETRIES = int(os.getenv("INDEX_MAX_RETRIES", "6"))
+INDEX_BACKOFF_SECONDS = float(os.getenv("INDEX_BACKOFF_SECONDS", "1"))
+
+
+def document_source(doc) -> tuple[str, str]:
+    # 문서 출처: url이 있으면 url, 없으면 name (주가 문서)
+    if doc.metadata.get("url"):
+        return "url", doc.metadata["url"]
+    return "name", doc.metadata.get("name") or ""
+
+
+def document_id(doc) -> str:
+
+    """
+    출처(url, 없으면 name)와 청크 내용의 해시로 만든 문서 ID
+
+    같은 기사나 같은 날짜의 주가 행을 다시 색인해도 같은 ID가 나온다.
+    """
+    source = document_source(doc)[1]
+    return hashlib.sha256(f"{source}\n{doc.page_content}".encode("utf-8")).hexdigest()
+
+
+def existing_ids(client, index_name: str, ids: list[str]) -> set[str]:
+    result = set()
+    for i in range(0, len(ids), MGET_BATCH_SIZE):
+        try:
+            response = client.mget(index=index_name, ids=ids[i:i + MGET_BATCH_SIZE], source=False)
+        except NotFoundError:
+            return set()
+        result.update(doc["_id"] for doc in response["docs"] if doc.get("found"))
+    return result
+
+
+def delete_superseded(client, index_name: str, sources: set[tuple[str, str]], keep_ids: list[str]) -> int:
+
+    """
+    sources에 속하지만 keep_ids에 없는 문서(내용이 바뀌어 ID가 달라진 이전 청크)를 삭제
+
+    Returns:
+        삭제한 문서 수
+    """
+    deleted = 0
+    for field in ("url", "name"):
+        values = sorted(value for source_field, value in sources if source_field == field)
+        for i in range(0, len(values), DELETE_BATCH_SIZE):
+            try:
+                response = client.delete_by_query(
+                    index=index_name,
+                    query={
+                        "bool": {
+                            "filter": [{"terms": {f"metadata.{field}.keyword": values[i:i + DELETE_BATCH_SIZE]}}],
+                            "must_not": [{"ids": {"values": keep_ids}}],
+                        }
+                    },
+                    refresh=True,
+                    conflicts="proceed",
+                )
+            except NotFoundError:
+                return deleted
+            deleted += response["deleted"]
+    if deleted:
+        print(f"Deleted {deleted} superseded chunks from {index_name}")
+    return deleted
+
+
+def is_rate_limited(error: Exception) -> bool:
+    # openai.RateLimitError, elasticsearch ApiError, bulk 항목 오류의 429를 모두 처리한다
+    if getattr(error, "status_code", None) == 429:
+        return True
+    if getattr(getattr(error, "meta", None), "status", None) == 429:
+        return True
+    if isinstance(error, BulkIndexError):
+        return all(
+            item.get("index", {}).get("status") == 429 for item in error.errors
+        )
+    return False
+
+
+def with_retry(fn, *args, **kwargs):
+    for attempt in range(INDEX_MAX_RETRIES + 1):
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            if attempt == INDEX_MAX_RETRIES or not is_rate_limited(e):
+                raise
+            delay = INDEX_BACKOFF_SECONDS * 2 ** attempt * (1 + random.random())
+            print(f"Rate limited, retrying in {delay:.1f}s ({attempt + 1}/{INDEX_MAX_RETRIES})")
+            time.sleep(delay)
+
+
+class IndexProgress:
+
+    def __init__(self, total: int):
+        self.total = total
+        self.docs = 0
+        self.tokens = 0
+        self.started_at = time.monotonic()
+
+    def update(self, docs: int, tokens: int):
+        self.docs += docs
+        self.tokens += tokens
+        elapsed = max(time.monotonic() - self.started_at, 1e-9)
+        print(
+            f"Indexed {self.docs}/{self.total} chunks "
+            f"({self.docs / elapsed:.1f} docs/s, {self.tokens / elapsed:.0f} tokens/s)"
+        )
+
+
+def index_documents(client, index_name: str, embedding, documents,
+                    batch_size: int = INDEX_BATCH_SIZE, concurrency: int = INDEX_CONCURRENCY) -> list[str]:
+
+    """
+    이미 색인된 청크는 건너뛰고 새 청크만 임베딩해서 색인
+
+    documents에는 출처(url, 없으면 name)별로 모든 청크가 들어 있어야 한다.
+    색인이 끝나면 같은 출처의 청크 중 이번에 없는 것(내용이 바뀌기 전 청크)을 삭제한다.
+
+    새 청크는 batch_size개씩 나눠 concurrency개의 배치를 동시에 임베딩하고 bulk 요청으로 색인한다.
+    동시에 진행 중인 배치 수를 concurrency개로 제한하고, 429 응답은 지수 백오프로 재시도한다.
+
+    Args:
+        client: Elasticsearch 클라이언트
+        index_name: 색인할 인덱스 이름
+        embedding: 임베딩 모델
+        documents: Document 목록
+        batch_size: 한 번에 임베딩하고 색인할 청크 수
+        concurrency: 동시에 처리할 배치 수
+
+    Returns:
+        새로 색인한 문서 ID 목록
+    """
+    unique_docs = dict()
+    for doc in documents:
+        unique_docs.setdefault(document_id(doc), doc)
+
+    ids = list(unique_docs.keys())
+    skip_ids = existing_ids(client, index_name, ids)
+    new_ids = [doc_id for doc_id in ids if doc_id not in skip_ids]
+    print(f"Skipped {len(documents) - len(new_ids)} existing or duplicate chunks")
+    sources = set(document_source(doc) for doc in unique_docs.values())
+    if not new_ids:
+        delete_superseded(client, index_name, sources, ids)
+        return []
+
+    store = ElasticsearchStore(
+        es_connection=client,
+        index_name=index_name,
+        embedding=embedding,
+    )
+    encoding = tiktoken.get_encoding("cl100k_base")
+    progress = IndexProgress(len(new_ids))
+
+    def index_batch(batch_ids):
+        texts = [unique_docs[doc_id].page_content for doc_id in batch_ids]
+        vectors = with_retry(embedding.embed_documents, texts)
+        with_retry(
+            store.add_embeddings,
+            text_embeddings=list(zip(texts, vectors)),
+            metadatas=[unique_docs[doc_id].metadata for doc_id in batch_ids],
+            ids=batch_ids,
+            refresh_indices=False,
+        )
+        return len(batch_ids), sum(len(tokens) for tokens in encoding.encode_ordinary_batch(texts))
+
+    batches = [new_ids[i:i + batch_size] for i in range(0, len(new_ids), batch_size)]
+    # 첫 배치에서 인덱스가 만들어지도록 먼저 처리한 뒤 나머지를 병렬로 보낸다
+    progress.update(*index_batch(batches[0]))
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        pending = set()
+        for batch_ids in batches[1:]:
+            if len(pending) >= concurrency:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    progress.update(*future.result())
+            pending.add(executor.submit(index_batch, batch_ids))
+        for future in wait(pending).done:
+            progress.update(*future.result())
+
+    client.indices.refresh(index=index_name)
+    print(f"Indexed {len(new_ids)} new chunks into {index_name}")
+    delete_superseded(client, index_name, sources, ids)
+    return new_ids
+
@@ -1,17 +1,28 @@
 import mojito
 import pandas as pd
+import random
 import time
 import os
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
-from data.util import convert_date_format, get_day_before
+from data.util import get_current_date, get_day_before
+from data.rate_limiter import RateLimiter
+from data.price_store import price_store
 
 load_dotenv(override=True)
 key = os.getenv("KOREA_INVESTMENT_API_KEY")
 secret = os.getenv("KOREA_INVESTMENT_API_SECRET")
 acc_no = os.getenv("KOREA_INVESTMENT_ACC_NO")
+# 실전 계좌 기준 초당 20건 제한보다 조금 낮게 잡는다 (모의투자 계좌는 2 이하로 설정)
+KIS_REQUESTS_PER_SECOND = float(os.getenv("KIS_REQUESTS_PER_SECOND", "15"))
+KIS_MAX_RETRIES = int(os.getenv("KIS_MAX_RETRIES", "5"))
+KIS_BACKOFF_SECONDS = float(os.getenv("KIS_BACKOFF_SECONDS", "0.5"))
+# 초당 거래건수 초과 응답 코드
+KIS_RATE_LIMIT_CODE = "EGW00201"
 
+rate_limiter = RateLimiter(KIS_REQUESTS_PER_SECOND)
 
 
 class UnvalidCompanyError(Exception):
@@ -33,6 +44,23 @@ us_analyzer = mojito.KoreaInvestment(
 )
 us_company_list = {"nvidia" : "NVDA" , "amd" : "AMD"}
 
+real_time_executor = ThreadPoolExecutor(max_workers=len(kr_company_list) + len(us_company_list))
+
+
+def kis_request(fn, *args, **kwargs) -> dict:
+
+    """
+    공유 토큰 버킷으로 초당 요청 수를 맞춰 KIS API를 호출하고, 초당 거래건수 초과 응답은 지수 백오프로 재시도
+    """
+    for attempt in range(KIS_MAX_RETRIES + 1):
+        rate_limiter.acquire()
+        response = fn(*args, **kwargs)
+        if response.get('msg_cd') != KIS_RATE_LIMIT_CODE or attempt == KIS_MAX_RETRIES:
+            return response
+        delay = KIS_BACKOFF_SECONDS * 2 ** attempt * (1 + random.random())
+        print(f"KIS rate limited, retrying in {delay:.1f}s ({attempt + 1}/{KIS_MAX_RETRIES})")
+        time.sleep(delay)
+
 
 def fetch_real_time(company_name: str) -> dict:
 
@@ -48,22 +76,35 @@ def fetch_real_time(company_name: str) -> dict:
     """
 
     if company_name in kr_company_list:
-        response = kr_analyzer.fetch_price(kr_company_list[company_name])['output']
+        response = kis_request(kr_analyzer.fetch_price, kr_company_list[company_name])['output']
         result = {kr_real_time_resp.get(k,k): v for k,v in response.items() if k in kr_real_time_resp}
         return result
     elif company_name in us_company_list:
-        response = us_analyzer.fetch_price(us_company_list[company_name])['output']
+        response = kis_request(us_analyzer.fetch_price, us_company_list[company_name])['output']
         result = {us_real_time_resp.get(k,k): v for k,v in response.items() if k in us_real_time_resp}
         return result
     else:
         raise UnvalidCompanyError
     
-def fetch_real_time_all():
+real_time_names = {"samsung": "삼성전자", "skhynix": "하이닉스", "nvidia": "NVIDIA", "amd": "AMD"}
+
+def fetch_real_time_all(timeout: float = None) -> dict:
+
+    """
+    네 종목의 실시간 주식 정보를 병렬로 조회 (시간 초과 또는 실패한 종목은 결과에서 제외)
+
+    Args:
+        timeout: 전체 조회 제한 시간(초), None이면 무제한
+    """
     result = dict()
-    result['삼성전자'] = fetch_real_time('samsung')
-    result['하이닉스'] = fetch_real_time('skhynix')
-    result['NVIDIA'] = fetch_real_time('nvidia')
-    result['AMD'] = fetch_real_time('amd')
+    futures = {name: real_time_executor.submit(fetch_real_time, company) for company, name in real_time_names.items()}
+    started_at = time.monotonic()
+    for name, future in futures.items():
+        remaining = None if timeout is None else max(0, started_at + timeout - time.monotonic())
+        try:
+            result[name] = future.result(timeout=remaining)
+        except Exception as e:
+            print(f"Failed to fetch real time data of {name}: {e!r}")
     return result
 
 def fetch_today_data(company_name: str) -> pd.DataFrame:
@@ -76,7 +117,7 @@ def fetch_today_data(company_name: str) -> pd.DataFrame:
     
     """
     if company_name in kr_company_list:
-        result = kr_analyzer.fetch_today_1m_ohlcv(kr_company_list[company_name])
+        result = kis_request(kr_analyzer.fetch_today_1m_ohlcv, kr_company_list[company_name])
         df = pd.DataFrame(result['output2'])
         dt = pd.to_datetime(df['stck_bsop_date'] + ' ' + df['stck_cntg_hour'], format="%Y%m%d %H%M%S")
         df.set_index(dt, inplace=True)
@@ -106,8 +147,7 @@ def fetch_today_data(company_name: str) -> pd.DataFrame:
             "FILL":"",
             "KEYB":""
         }
-        result = requests.get(url, headers=headers, params=paramss)
-        result = result.json()
+        result = kis_request(lambda: requests.get(url, headers=headers, params=paramss).json())
         df = pd.DataFrame(result['output2'])
         dt = pd.to_datetime(df['kymd'] + ' ' + df['khms'], format="%Y%m%d %H%M%S")
         df.set_index(dt, inplace=True)
@@ -132,6 +172,7 @@ def fetch_previous_data(company_name: str, start_date: str, end_date: str, timef
     
     returns:
         DataFrame (column : 날짜, 회사명, 시가, 최고가, 최저가, 종가, 거래량)
+        가격은 float32, 거래량은 int64, 날짜는 datetime64, 회사명은 category이며 통화는 df.attrs["currency"]에 있다
     """
     if company_name in kr_company_list:
         data_lst = []
@@ -139,12 +180,14 @@ def fetch_previous_data(company_name: str, start_date: str, end_date: str, timef
             data = kr_get_previous(company_name, start_date, end_date, timeframe, is_adjusted)
             try:
                 day = data[-1]['stck_bsop_date']
-            except KeyError:
+            except (KeyError, IndexError):
                 break
             data_lst.extend(data)
             if start_date < day:
                 end_date = get_day_before(day)
             else: break
+        if not data_lst:
+            return empty_price_frame()
         return kr_set_df(data_lst, company_name)
     elif company_name in us_company_list:
         data_lst = []
@@ -152,28 +195,120 @@ def fetch_previous_data(company_name: str, start_date: str, end_date: str, timef
              data = us_get_previous(company_name, end_date, timeframe, is_adjusted)
              try:
                  day = data[-1]['xymd']
-             except KeyError:
+             except (KeyError, IndexError):
                  break
              data_lst.extend(data)
              if start_date < day:
                  end_date = get_day_before(day)
              else: break
+        if not data_lst:
+            return empty_price_frame()
         return us_set_df(data_lst, company_name, start_date)
     else:
         raise UnvalidCompanyError
         
+PRICE_COLUMNS = ['날짜','회사명', '시가', '최고가', '최저가', '종가','거래량']
+PRICE_DTYPES = {'시가': 'float32', '최고가': 'float32', '최저가': 'float32', '종가': 'float32', '거래량': 'int64'}
+STORE_COLUMNS = {'날짜': 'date', '시가': 'open', '최고가': 'high', '최저가': 'low', '종가': 'close', '거래량': 'volume'}
+company_display_names = {"samsung": "삼성전자", "skhynix": "SK하이닉스", "nvidia": "NVIDIA", "amd": "AMD"}
+company_currency = {"삼성전자": "₩", "SK하이닉스": "₩", "NVIDIA": "$", "AMD": "$"}
+COMPANY_DTYPE = pd.CategoricalDtype(list(company_display_names.values()))
+
+def set_price_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    df = df.astype({'회사명': COMPANY_DTYPE, **PRICE_DTYPES})
+    df['날짜'] = pd.to_datetime(df['날짜'])
+    df.attrs['currency'] = company_currency
+    return df
+
+def empty_price_frame() -> pd.DataFrame:
+    return set_price_dtypes(pd.DataFrame(columns=PRICE_COLUMNS))
+
+def to_store_frame(df: pd.DataFrame) -> pd.DataFrame:
+    return df[list(STORE_COLUMNS)].rename(columns=STORE_COLUMNS)
+
+def from_store_frame(df: pd.DataFrame) -> pd.DataFrame:
+    result = df.rename(columns={v: k for k, v in STORE_COLUMNS.items()})
+    result['회사명'] = df['ticker'].map(company_display_names)
+    return set_price_dtypes(result[PRICE_COLUMNS])
+
+def render_price_frame(df: pd.DataFrame) -> pd.DataFrame:
+
+    """
+    숫자형 주가 DataFrame을 문서에 넣을 문자열로 변환 (날짜는 "2024년 5월 2일", 가격에는 통화 기호)
+
+    행마다 함수를 호출하지 않고 열 단위로 한 번에 변환한다.
+    """
+    currency = df['회사명'].astype(str).map(df.attrs.get('currency', company_currency)).fillna('')
+    rendered = pd.DataFrame({
+        '날짜': render_dates(df['날짜']),
+        '회사명': df['회사명'].astype(str),
+    }, index=df.index)
+    for col in ['시가', '최고가', '최저가', '종가']:
+        rendered[col] = render_prices(df[col], currency)
+    rendered['거래량'] = df['거래량'].astype(str)
+    return rendered
+
+def render_dates(dates: pd.Series) -> pd.Series:
+    dates = dates.dt
+    return dates.year.astype(str) + '년 ' + dates.month.astype(str) + '월 ' + dates.day.astype(str) + '일'
+
+def render_prices(prices: pd.Series, currency: pd.Series) -> pd.Series:
+    # 원화는 정수, 달러는 소수점 둘째 자리까지 표시한다
+    prices = prices.astype('float64')
+    return prices.round(2).astype(str).where(currency == '$', prices.round().astype('int64').astype(str)) + currency
+
+def sync_price_history(company_name: str, start_date: str, end_date: str):
+
+    """
+    로컬 가격 저장소에 없는 기간만 KIS에서 받아 추가
+    """
+    for missing_start, missing_end in price_store.missing_ranges(company_name, start_date, end_date):
+        df = fetch_previous_data(company_name, missing_start, missing_end)
+        price_store.append(company_name, to_store_frame(df), missing_start, missing_end)
+
+def get_unsettled_start(company_name: str) -> str:
+
+    """
+    장이 끝나지 않았을 수 있는 첫 날("YYYYMMDD"), 이 날부터의 시세는 아직 바뀔 수 있다
+
+    미국 장은 한국 시간으로 다음 날 새벽에 끝나므로 하루 더 이르다.
+    """
+    unsettled_start = get_current_date()
+    if company_name in us_company_list:
+        unsettled_start = get_day_before(unsettled_start)
+    return unsettled_start
+
+def fetch_company_data(company_name: str, start_date: str, end_date: str, timeframe: str='D', is_adjusted: bool = True) -> pd.DataFrame:
+    if timeframe != 'D' or not is_adjusted:
+        return fetch_previous_data(company_name, start_date, end_date, timeframe, is_adjusted)
+
+    # 장이 끝나지 않았을 수 있는 날의 시세는 저장하지 않고 매번 새로 받는다
+    unsettled_start = get_unsettled_start(company_name)
+    settled_end = min(end_date, get_day_before(unsettled_start))
+    frames = []
+    if start_date <= settled_end:
+        sync_price_history(company_name, start_date, settled_end)
+        frames.append(from_store_frame(price_store.read([company_name], start_date, settled_end)))
+    if end_date >= unsettled_start:
+        frames.append(fetch_previous_data(company_name, max(start_date, unsettled_start), end_date))
+    return set_price_dtypes(pd.concat(frames, ignore_index=True))
+
 def fetch_all_company_data(start_date: str, end_date: str, timeframe: str='D', is_adjusted: bool = True):
-    result = dict() 
-    for key in kr_company_list.keys():
-        result[key] = fetch_previous_data(key, start_date, end_date, timeframe, is_adjusted)
-    for key in us_company_list.keys():
-        result[key] = fetch_previous_data(key, start_date, end_date, timeframe, is_adjusted)
+
+    """
+    네 종목의 기간별 주가 (일봉 수정 주가는 data/stock/parquet 저장소에 없는 기간만 새로 받는다)
+    """
+    # 종목마다 과거로 페이지를 넘기는 요청은 순차적이지만, 종목끼리는 같은 rate_limiter를 공유하며 동시에 진행한다
+    companies = list(kr_company_list.keys()) + list(us_company_list.keys())
+    with ThreadPoolExecutor(max_workers=len(companies)) as executor:
+        futures = {
+            key: executor.submit(fetch_company_data, key, start_date, end_date, timeframe, is_adjusted)
+            for key in companies
+        }
+        result = {key: future.result() for key, future in futures.items()}
     combined_df = pd.concat(result.values(), ignore_index=True)
-    sorted_df = combined_df.sort_values(by='날짜')
-    sorted_df['날짜'] = sorted_df['날짜'].apply(format_date)
-    csv_path = os.path.join(os.path.dirname(__file__), "stock", f'stock_{convert_date_format(start_date)}_to_{convert_date_format(end_date)}.csv')
-    os.makedirs(os.path.dirname(csv_path), exist_ok=True)
-    sorted_df.to_csv(csv_path, index=False)
+    sorted_df = combined_df.sort_values(by='날짜', kind='stable', ignore_index=True)
+    sorted_df.attrs['currency'] = company_currency
     return sorted_df
 
 
@@ -208,8 +343,8 @@ us_real_time_resp = {
 }
 
 def kr_get_previous(company_name: str, start_date: str, end_date: str, timeframe: str ='D', is_adjusted: bool = True) -> list[dict]:
-    time.sleep(0.1)
-    response = kr_analyzer.fetch_ohlcv_domestic (
+    response = kis_request(
+            kr_analyzer.fetch_ohlcv_domestic,
             symbol = kr_company_list[company_name],
             timeframe = timeframe,
             start_day = start_date,
@@ -219,8 +354,8 @@ def kr_get_previous(company_name: str, start_date: str, end_date: str, timeframe
     return response['output2']
 
 def us_get_previous(company_name: str, end_day: str, timeframe: str ='D', is_adjusted: bool = True) -> list[dict]:
-    time.sleep(0.1)
-    response = us_analyzer.fetch_ohlcv_overesea (
+    response = kis_request(
+            us_analyzer.fetch_ohlcv_overesea,
             symbol = us_company_list[company_name],
             timeframe = timeframe,
             end_day = end_day,
@@ -231,26 +366,19 @@ def us_get_previous(company_name: str, end_day: str, timeframe: str ='D', is_adj
 def kr_set_df(response: list, company_name: str) -> pd.DataFrame:
     df = pd.DataFrame(response)
     df['stck_bsop_date'] = pd.to_datetime(df['stck_bsop_date'], format='%Y%m%d')
-    df['company'] = "삼성전자" if company_name == "samsung" else "SK하이닉스"
+    df['company'] = company_display_names[company_name]
     df = df[['stck_bsop_date', 'company', 'stck_oprc', 'stck_hgpr', 'stck_lwpr', 'stck_clpr','acml_vol' ]]
-    df.columns = ['날짜','회사명', '시가', '최고가', '최저가', '종가','거래량']
-    for col in df.columns[2:]:  
-        df[col] = df[col].astype(str) + '₩'
-    return df
+    df.columns = PRICE_COLUMNS
+    return set_price_dtypes(df)
 
 def us_set_df(response: list, company_name: str, start_date: str) -> pd.DataFrame:
     df = pd.DataFrame(response)
     df = df[df['xymd'] >= start_date]
     df['xymd'] = pd.to_datetime(df['xymd'], format='%Y%m%d')
-    df['company'] = company_name.upper()
+    df['company'] = company_display_names[company_name]
     df = df[['xymd','company','open', 'high', 'low', 'clos', 'tvol']]
-    df.columns = ['날짜','회사명', '시가', '최고가', '최저가', '종가','거래량']
-    for col in df.columns[2:]:  
-        df[col] = df[col].astype(str) + '$'
-    return df
-
-def format_date(date):
-    return f"{date.year}년 {date.month}월 {date.day}일"
+    df.columns = PRICE_COLUMNS
+    return set_price_dtypes(df)
 
 
 
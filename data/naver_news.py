@@ -1,19 +1,55 @@
 import os
-import urllib.request
 import requests
-import json
 import re
 from bs4 import BeautifulSoup
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from dotenv import load_dotenv
 
+from data.rate_limiter import RateLimiter
+from data.seen_urls import SeenUrlIndex
+from data.pipeline import bounded_map, stream_to_json
+
 # 환경 변수 로드
 load_dotenv(override=True)
 
 client_id = os.getenv("NAVER_CLIENT_ID")
 client_secret = os.getenv("NAVER_CLIENT_SECRET")
 
+NAVER_SEARCH_URL = "https://openapi.naver.com/v1/search/news.json"
+NAVER_CRAWL_WORKERS = int(os.getenv("NAVER_CRAWL_WORKERS", "8"))
+NAVER_REQUESTS_PER_SECOND = float(os.getenv("NAVER_REQUESTS_PER_SECOND", "10"))
+
+rate_limiter = RateLimiter(NAVER_REQUESTS_PER_SECOND)
+
+
+def create_session():
+    session = requests.Session()
+    retry = Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504])
+    adapter = HTTPAdapter(pool_connections=NAVER_CRAWL_WORKERS, pool_maxsize=NAVER_CRAWL_WORKERS, max_retries=retry)
+    session.mount("https://", adapter)
+    session.headers.update({'User-agent': 'Mozilla/5.0'})
+    return session
+
+session = create_session()
+seen_urls = SeenUrlIndex()
+
+
+def news_save_path(day_before=1):
+    current_date = datetime.now()
+    start_date = current_date - timedelta(days=day_before)
+    current_date_str = current_date.strftime('%Y-%m-%d')
+    start_date_str = start_date.strftime('%Y-%m-%d')
+    file_name = f'news_{start_date_str}_to_{current_date_str}.json'
+    return os.path.join(os.path.dirname(__file__), 'news', 'naver', file_name)
+
 def get_news_naver(day_before=1,length=100,sort="sim"):
+    items = iter_news_naver(day_before=day_before, length=length, sort=sort)
+    return list(stream_to_json(items, news_save_path(day_before)))
+
+def iter_news_naver(day_before=1,length=100,sort="sim"):
     keywords = {
         "samsung": ["삼성전자", "삼전"],
         "skhynix": ["하이닉스", "하닉"],
@@ -21,61 +57,89 @@ def get_news_naver(day_before=1,length=100,sort="sim"):
         "amd": ["AMD"]
     }
 
-    responses = []
-
     display = min(100, length)
     start_from = 1
     current_date = datetime.now()
     start_date = current_date - timedelta(days=day_before)
 
+    searches = [
+        (company, keyword, start)
+        for company in keywords.keys()
+        for keyword in keywords[company]
+        for start in range(start_from, length, display)
+    ]
+    with ThreadPoolExecutor(max_workers=NAVER_CRAWL_WORKERS) as executor:
+        search_results = executor.map(lambda args: search_news(*args, display=display, sort=sort), searches)
+        # 여러 키워드(삼성전자/삼전 등)에 같이 걸린 기사는 한 번만 가져온다
+        items = dict()
+        for (company, _, _), result in zip(searches, search_results):
+            for item in result:
+                if start_date <= parse_pub_date(item['pubDate']) <= current_date:
+                    if item['link'].startswith("https://n.news.naver.com"):
+                        items.setdefault(item['link'], (company, item))
 
-    for company in keywords.keys():
-        for keyword in keywords[company]:
-            for start in range(start_from, length, display):
-                encText = urllib.parse.quote(keyword)
-                url = f"https://openapi.naver.com/v1/search/news.json?query={encText}&display={display}&start={start}&sort={sort}"
-                request = urllib.request.Request(url)
-                request.add_header("X-Naver-Client-Id", client_id)
-                request.add_header("X-Naver-Client-Secret", client_secret)
-                response = urllib.request.urlopen(request)
-                rescode = response.getcode()
-                if rescode == 200:
-                    response_body = response.read().decode('utf-8')
-                    search_results = json.loads(response_body)
-                    for item in search_results['items']:
-                        pubDate = datetime.strptime(item['pubDate'], "%a, %d %b %Y %H:%M:%S %z")
-                        pubDate = pubDate.replace(tzinfo=None)
-                        if start_date <= pubDate <= current_date:
-                            if item['link'].startswith("https://n.news.naver.com"):
-                                responses.append({
-                                    "company": format_company(company),
-                                    "name": format_title(item['title']),
-                                    "url": item['link'],
-                                    "content": get_news_text(item['link']),
-                                    "updated_at": format_date(item['pubDate']),
-                                    "category": "news"
-                                })
-                else:
-                        continue
-    current_date_str = current_date.strftime('%Y-%m-%d')
-    start_date_str = start_date.strftime('%Y-%m-%d')
-    file_name = f'news_{start_date_str}_to_{current_date_str}.json'
-    save_path = os.path.join(os.path.dirname(__file__), 'news', 'naver', file_name)
-    os.makedirs(os.path.dirname(save_path), exist_ok=True)
-    with open(save_path, 'w') as json_file:
-        json.dump(responses, json_file, ensure_ascii=False, indent=4)
-    return responses
+        def fetch(entry):
+            company, item = entry
+            return company, item, fetch_article(item['link'])
+
+        for company, item, content in bounded_map(executor, fetch, items.values(), NAVER_CRAWL_WORKERS * 2):
+            if content is None:
+                continue
+            yield {
+                "company": format_company(company),
+                "name": format_title(item['title']),
+                "url": item['link'],
+                "content": content,
+                "updated_at": format_date(item['pubDate']),
+                "category": "news"
+            }
+
+def search_news(company, keyword, start, display=100, sort="sim"):
+    rate_limiter.acquire()
+    try:
+        response = session.get(
+            NAVER_SEARCH_URL,
+            params={"query": keyword, "display": display, "start": start, "sort": sort},
+            headers={"X-Naver-Client-Id": client_id, "X-Naver-Client-Secret": client_secret},
+            timeout=10,
+        )
+        response.raise_for_status()
+        return response.json()['items']
+    except Exception as e:
+        print(f"Failed to search news for {keyword} (start={start}): {e!r}")
+        return []
+
+def fetch_article(url):
+    content = seen_urls.get(url)
+    if content is None:
+        content = get_news_text(url)
+        if content is not None:
+            seen_urls.put(url, content)
+    return content
 
 def get_news_text(url):
-    req = requests.get(url, headers={'User-agent': 'Mozilla/5.0'})
+    rate_limiter.acquire()
+    try:
+        req = session.get(url, timeout=10)
+        req.raise_for_status()
+    except Exception as e:
+        print(f"Failed to fetch {url}: {e!r}")
+        return None
     soup = BeautifulSoup(req.text, "lxml")
     text = soup.find('article', class_='go_trans _article_content', id='dic_area')
+    if text is None:
+        print(f"Article body not found: {url}")
+        return None
 
     for br in text.find_all("br"):
         br.decompose()
 
     return text.get_text(strip=True)
 
+def parse_pub_date(date_str):
+    pubDate = datetime.strptime(date_str, "%a, %d %b %Y %H:%M:%S %z")
+    return pubDate.replace(tzinfo=None)
+
 def format_date(date_str):
     date_obj = datetime.strptime(date_str, '%a, %d %b %Y %H:%M:%S %z')
     formatted_date = date_obj.strftime('%Y-%m-%d')
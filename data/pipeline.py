@@ -0,0 +1,133 @@
+from collections import deque
+import json
+import os
+import queue
+import threading
+from dotenv import load_dotenv
+
+load_dotenv(override=True)
+
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "512"))
+PIPELINE_BATCH_SIZE = int(os.getenv("PIPELINE_BATCH_SIZE", "1024"))
+
+_DONE = object()
+
+
+def bounded_map(executor, fn, items, window: int):
+
+    """
+    executor.map과 같지만 동시에 실행 중인 작업을 window개로 제한하고 결과를 순서대로 yield
+
+    executor.map은 모든 작업을 한 번에 제출하므로 결과가 소비되지 않으면 메모리에 계속 쌓인다.
+    """
+    pending = deque()
+    for item in items:
+        pending.append(executor.submit(fn, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def stream_to_json(items, save_path: str):
+
+    """
+    items를 그대로 흘려보내면서 JSON 배열 파일로 하나씩 기록
+
+    임시 파일에 쓰고 끝까지 기록한 뒤에만 save_path로 옮기므로 도중에 실패해도 잘린 파일이 남지 않는다.
+    """
+    os.makedirs(os.path.dirname(save_path), exist_ok=True)
+    tmp_path = f"{save_path}.tmp"
+    try:
+        with open(tmp_path, 'w') as json_file:
+            json_file.write("[")
+            for i, item in enumerate(items):
+                json_file.write(",\n" if i else "\n")
+                json_file.write(json.dumps(item, ensure_ascii=False, indent=4))
+                yield item
+            json_file.write("\n]")
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, save_path)
+
+
+def _put(output: queue.Queue, item, stop: threading.Event) -> bool:
+    # 소비자가 멈추면 가득 찬 큐에서 영원히 기다리지 않도록 stop을 주기적으로 확인한다
+    while not stop.is_set():
+        try:
+            output.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _produce(items, to_documents, splitter, output: queue.Queue, stop: threading.Event):
+    try:
+        for item in items:
+            documents = to_documents(item)
+            if splitter is not None:
+                documents = splitter.split_documents(documents)
+            for document in documents:
+                if not _put(output, document, stop):
+                    return
+    except BaseException as e:
+        _put(output, e, stop)
+    finally:
+        close = getattr(items, "close", None)
+        if close is not None:
+            close()
+        _put(output, _DONE, stop)
+
+
+def run_pipeline(items, to_documents, index_batch, splitter=None, group_key=None,
+                 batch_size: int = PIPELINE_BATCH_SIZE, queue_size: int = PIPELINE_QUEUE_SIZE) -> int:
+
+    """
+    fetch → parse → split → embed → index 단계를 크기가 제한된 큐로 연결해 실행
+
+    items(수집 제너레이터)를 읽어 Document로 바꾸고 나누는 단계는 별도 스레드에서,
+    batch_size개씩 모아 임베딩·색인하는 단계는 현재 스레드에서 실행한다.
+    큐가 가득 차면 수집이 멈추므로 최대 메모리 사용량은 기간 길이와 무관하다.
+    어느 단계에서든 예외가 나면 수집 스레드를 멈추고 기다린 뒤 그 예외를 다시 올린다.
+
+    Args:
+        items: 원본 항목을 yield하는 제너레이터
+        to_documents: 원본 항목 하나를 Document 목록으로 바꾸는 함수
+        index_batch: Document 목록을 색인하고 새로 색인한 문서 수를 돌려주는 함수
+        splitter: 청크 분할기 (None이면 나누지 않음)
+        group_key: 지정하면 같은 키가 연속된 Document는 배치를 나누지 않는다 (출처별로 모든 청크가 한 배치에 들어감)
+
+    Returns:
+        새로 색인한 문서 수
+    """
+    documents = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    producer = threading.Thread(target=_produce, args=(items, to_documents, splitter, documents, stop), daemon=True)
+    producer.start()
+
+    indexed = 0
+    loaded = 0
+    batch = []
+    try:
+        while True:
+            document = documents.get()
+            if document is _DONE:
+                break
+            if isinstance(document, BaseException):
+                raise document
+            if len(batch) >= batch_size and (
+                group_key is None or group_key(document) != group_key(batch[-1])
+            ):
+                indexed += index_batch(batch)
+                batch = []
+            batch.append(document)
+            loaded += 1
+        if batch:
+            indexed += index_batch(batch)
+    finally:
+        stop.set()
+        producer.join()
+    print(f"Loaded {loaded} chunks, indexed {indexed} new chunks")
+    return indexed
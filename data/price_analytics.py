@@ -0,0 +1,120 @@
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
+
+from data.korea_investment import company_display_names, company_currency
+from data.price_store import price_store
+
+TRADING_DAYS_PER_YEAR = 252
+
+
+def to_day(date: str) -> str:
+    return datetime.strptime(date, "%Y-%m-%d").strftime("%Y%m%d")
+
+
+def load_closes(ticker: str, start_date: str, end_date: str) -> pd.Series:
+
+    """
+    로컬 가격 저장소에서 start_date~end_date("YYYY-MM-DD") 종가를 날짜 인덱스 Series로 읽는다.
+    """
+    if ticker not in company_display_names:
+        raise ValueError(f"Unknown ticker {ticker}. Use one of: {', '.join(company_display_names)}")
+    df = price_store.read([ticker], to_day(start_date), to_day(end_date))
+    if df.empty:
+        raise ValueError(f"No price data for {ticker} between {start_date} and {end_date}")
+    return df.set_index("date")["close"].astype("float64")
+
+
+def describe(ticker: str, closes: pd.Series) -> dict:
+    company = company_display_names[ticker]
+    return {
+        "company": company,
+        "currency": company_currency[company],
+        "start_date": closes.index[0].strftime("%Y-%m-%d"),
+        "end_date": closes.index[-1].strftime("%Y-%m-%d"),
+        "trading_days": len(closes),
+    }
+
+
+def period_return(ticker: str, start_date: str, end_date: str) -> dict:
+
+    """
+    기간 첫 거래일 종가 대비 마지막 거래일 종가의 등락과 기간 중 최고·최저 종가
+    """
+    closes = load_closes(ticker, start_date, end_date)
+    first, last = closes.iloc[0], closes.iloc[-1]
+    return {
+        **describe(ticker, closes),
+        "start_close": round(first, 2),
+        "end_close": round(last, 2),
+        "change": round(last - first, 2),
+        "return_pct": round((last / first - 1) * 100, 2),
+        "high_close": round(closes.max(), 2),
+        "high_date": closes.idxmax().strftime("%Y-%m-%d"),
+        "low_close": round(closes.min(), 2),
+        "low_date": closes.idxmin().strftime("%Y-%m-%d"),
+    }
+
+
+def moving_average(ticker: str, end_date: str, window: int = 20) -> dict:
+
+    """
+    end_date까지 최근 window 거래일의 종가 이동평균과 마지막 종가의 이격도
+    """
+    # 휴장일을 감안해 거래일 수의 두 배 정도의 달력 기간을 읽는다
+    start_date = (datetime.strptime(end_date, "%Y-%m-%d") - timedelta(days=window * 2 + 10)).strftime("%Y-%m-%d")
+    closes = load_closes(ticker, start_date, end_date).iloc[-window:]
+    average = closes.mean()
+    return {
+        **describe(ticker, closes),
+        "window": window,
+        "moving_average": round(average, 2),
+        "close": round(closes.iloc[-1], 2),
+        "close_vs_average_pct": round((closes.iloc[-1] / average - 1) * 100, 2),
+    }
+
+
+def volatility(ticker: str, start_date: str, end_date: str) -> dict:
+
+    """
+    일간 로그 수익률의 표준편차와 연율화 변동성
+    """
+    closes = load_closes(ticker, start_date, end_date)
+    if len(closes) < 3:
+        raise ValueError(f"Not enough trading days for {ticker} between {start_date} and {end_date}")
+    returns = np.diff(np.log(closes.to_numpy()))
+    daily = returns.std(ddof=1)
+    return {
+        **describe(ticker, closes),
+        "daily_volatility_pct": round(daily * 100, 2),
+        "annualized_volatility_pct": round(daily * np.sqrt(TRADING_DAYS_PER_YEAR) * 100, 2),
+    }
+
+
+def max_drawdown(ticker: str, start_date: str, end_date: str) -> dict:
+
+    """
+    기간 중 고점 대비 최대 하락률과 그 고점·저점 날짜
+    """
+    closes = load_closes(ticker, start_date, end_date)
+    values = closes.to_numpy()
+    drawdowns = values / np.maximum.accumulate(values) - 1
+    trough = int(drawdowns.argmin())
+    peak = int(values[:trough + 1].argmax())
+    return {
+        **describe(ticker, closes),
+        "max_drawdown_pct": round(drawdowns[trough] * 100, 2),
+        "peak_date": closes.index[peak].strftime("%Y-%m-%d"),
+        "peak_close": round(values[peak], 2),
+        "trough_date": closes.index[trough].strftime("%Y-%m-%d"),
+        "trough_close": round(values[trough], 2),
+    }
+
+
+def compare_returns(tickers: list[str], start_date: str, end_date: str) -> list[dict]:
+
+    """
+    여러 종목의 기간 수익률을 높은 순으로 정렬
+    """
+    results = [period_return(ticker, start_date, end_date) for ticker in tickers]
+    return sorted(results, key=lambda result: result["return_pct"], reverse=True)
@@ -0,0 +1,160 @@
+import json
+import os
+import threading
+import uuid
+from datetime import datetime, timedelta
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+from dotenv import load_dotenv
+
+load_dotenv(override=True)
+
+PRICE_STORE_PATH = os.getenv(
+    "PRICE_STORE_PATH", os.path.join(os.path.dirname(__file__), "stock", "parquet")
+)
+
+PRICE_SCHEMA = pa.schema([
+    ("date", pa.timestamp("ns")),
+    ("open", pa.float32()),
+    ("high", pa.float32()),
+    ("low", pa.float32()),
+    ("close", pa.float32()),
+    ("volume", pa.int64()),
+    ("ticker", pa.string()),
+    ("year", pa.int32()),
+])
+PARTITIONING = ds.partitioning(
+    pa.schema([("ticker", pa.string()), ("year", pa.int32())]), flavor="hive"
+)
+
+
+def parse_day(day: str) -> datetime:
+    return datetime.strptime(day, "%Y%m%d")
+
+
+def format_day(day: datetime) -> str:
+    return day.strftime("%Y%m%d")
+
+
+def merge_ranges(ranges: list) -> list:
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and parse_day(start) <= parse_day(merged[-1][1]) + timedelta(days=1):
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+class PriceStore:
+
+    """
+    일봉(수정 주가)을 ticker/year로 파티션한 Parquet 데이터셋
+
+    이미 받아 둔 기간은 _manifest.json에 종목별 [시작일, 종료일] 목록으로 기록해 두고,
+    append는 겹치지 않는 기간의 행만 새 파일로 추가한다.
+    """
+
+    def __init__(self, path: str = PRICE_STORE_PATH):
+        self.path = path
+        self.manifest_path = os.path.join(path, "_manifest.json")
+        self.lock = threading.Lock()
+        self.manifest = self.load_manifest()
+
+    def load_manifest(self) -> dict:
+        if not os.path.exists(self.manifest_path):
+            return dict()
+        with open(self.manifest_path, "r") as f:
+            return json.load(f)
+
+    def save_manifest(self):
+        os.makedirs(self.path, exist_ok=True)
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.manifest, f, indent=4)
+        os.replace(tmp_path, self.manifest_path)
+
+    def version(self) -> int:
+
+        """
+        저장된 가격이 바뀔 때마다 달라지는 값 (다른 프로세스가 append해도 알 수 있도록 _manifest.json의 수정 시각을 쓴다)
+        """
+        try:
+            return os.stat(self.manifest_path).st_mtime_ns
+        except FileNotFoundError:
+            return 0
+
+    def missing_ranges(self, ticker: str, start_date: str, end_date: str) -> list[tuple[str, str]]:
+
+        """
+        start_date~end_date("YYYYMMDD") 중 아직 저장하지 않은 기간 목록
+        """
+        with self.lock:
+            covered = [list(r) for r in self.manifest.get(ticker, [])]
+        result = []
+        cursor = parse_day(start_date)
+        end = parse_day(end_date)
+        for covered_start, covered_end in covered:
+            covered_start, covered_end = parse_day(covered_start), parse_day(covered_end)
+            if covered_end < cursor:
+                continue
+            if covered_start > end:
+                break
+            if covered_start > cursor:
+                result.append((format_day(cursor), format_day(covered_start - timedelta(days=1))))
+            cursor = max(cursor, covered_end + timedelta(days=1))
+        if cursor <= end:
+            result.append((format_day(cursor), format_day(end)))
+        return result
+
+    def append(self, ticker: str, df: pd.DataFrame, start_date: str, end_date: str):
+
+        """
+        start_date~end_date 기간을 받아 온 결과(df: date, open, high, low, close, volume)를 저장하고 기간을 기록
+
+        거래일이 없어 df가 비어 있어도 기간은 기록해서 다시 요청하지 않는다.
+        """
+        if not df.empty:
+            frame = df[["date", "open", "high", "low", "close", "volume"]].copy()
+            frame["ticker"] = ticker
+            frame["year"] = frame["date"].dt.year
+            table = pa.Table.from_pandas(frame, schema=PRICE_SCHEMA, preserve_index=False)
+            ds.write_dataset(
+                table,
+                self.path,
+                format="parquet",
+                partitioning=PARTITIONING,
+                basename_template=f"part-{uuid.uuid4().hex}-{{i}}.parquet",
+                existing_data_behavior="overwrite_or_ignore",
+            )
+        with self.lock:
+            self.manifest[ticker] = merge_ranges(self.manifest.get(ticker, []) + [[start_date, end_date]])
+            self.save_manifest()
+
+    def read(self, tickers: list[str] = None, start_date: str = None, end_date: str = None) -> pd.DataFrame:
+
+        """
+        종목과 기간으로 거른 일봉 (파티션과 Parquet 통계로 필요한 파일만 읽는다)
+        """
+        if not os.path.isdir(self.path) or not any(
+            name.startswith("ticker=") for name in os.listdir(self.path)
+        ):
+            return pa.Table.from_pylist([], schema=PRICE_SCHEMA).to_pandas().drop(columns=["year"])
+
+        dataset = ds.dataset(self.path, schema=PRICE_SCHEMA, format="parquet", partitioning=PARTITIONING)
+        condition = ds.scalar(True)
+        if tickers is not None:
+            condition &= ds.field("ticker").isin(tickers)
+        if start_date is not None:
+            start = parse_day(start_date)
+            condition &= (ds.field("year") >= start.year) & (ds.field("date") >= pa.scalar(start, pa.timestamp("ns")))
+        if end_date is not None:
+            end = parse_day(end_date)
+            condition &= (ds.field("year") <= end.year) & (ds.field("date") <= pa.scalar(end, pa.timestamp("ns")))
+        df = dataset.to_table(filter=condition).to_pandas()
+        df = df.drop(columns=["year"]).drop_duplicates(subset=["ticker", "date"], keep="last")
+        return df.sort_values(["date", "ticker"], ignore_index=True)
+
+
+price_store = PriceStore()
@@ -0,0 +1,83 @@
+import os
+import threading
+import time
+from dotenv import load_dotenv
+
+from data.korea_investment import fetch_real_time_all
+
+load_dotenv(override=True)
+
+QUOTE_CACHE_TTL = float(os.getenv("QUOTE_CACHE_TTL", "30"))
+QUOTE_REFRESH_TIMEOUT = float(os.getenv("QUOTE_REFRESH_TIMEOUT", "5"))
+
+
+class QuoteCache:
+
+    """
+    프로세스 전체에서 공유하는 실시간 시세 캐시
+
+    백그라운드 스레드가 ttl마다 시세를 갱신하고, 동시에 들어온 갱신 요청은 진행 중인 갱신 하나를 함께 기다린다.
+    API가 느리거나 실패하면 마지막으로 성공한 스냅샷을 그대로 돌려준다.
+    """
+
+    def __init__(self, fetch, ttl: float = QUOTE_CACHE_TTL):
+        self.fetch = fetch
+        self.ttl = ttl
+        self.snapshot = {}
+        self.fetched_at = 0.0
+        self.lock = threading.Lock()
+        self.in_flight = None
+        self.refresher = None
+
+    def refresh(self, timeout: float = None) -> dict:
+        with self.lock:
+            done = self.in_flight
+            is_leader = done is None
+            if is_leader:
+                done = self.in_flight = threading.Event()
+
+        if not is_leader:
+            done.wait(timeout)
+            return self.snapshot
+
+        try:
+            result = self.fetch()
+            if result:
+                with self.lock:
+                    # 일부 종목만 실패한 경우 해당 종목은 이전 값을 유지한다
+                    self.snapshot = {**self.snapshot, **result}
+                    self.fetched_at = time.monotonic()
+        except Exception as e:
+            print(f"Failed to refresh real time quotes: {e!r}")
+        finally:
+            with self.lock:
+                self.in_flight = None
+            done.set()
+        return self.snapshot
+
+    def is_stale(self) -> bool:
+        return time.monotonic() - self.fetched_at > self.ttl
+
+    def get(self, timeout: float = QUOTE_REFRESH_TIMEOUT) -> dict:
+        self.start()
+        if not self.snapshot:
+            return self.refresh(timeout)
+        if self.is_stale() and self.in_flight is None:
+            # 백그라운드 갱신이 밀린 경우에도 요청은 기다리지 않는다
+            threading.Thread(target=self.refresh, daemon=True).start()
+        return self.snapshot
+
+    def start(self):
+        with self.lock:
+            if self.refresher is not None:
+                return
+            self.refresher = threading.Thread(target=self._run, name="quote-cache", daemon=True)
+        self.refresher.start()
+
+    def _run(self):
+        while True:
+            self.refresh()
+            time.sleep(self.ttl)
+
+
+quote_cache = QuoteCache(lambda: fetch_real_time_all(timeout=QUOTE_REFRESH_TIMEOUT))
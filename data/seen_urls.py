@@ -0,0 +1,42 @@
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from dotenv import load_dotenv
+
+load_dotenv(override=True)
+
+SEEN_URLS_PATH = os.getenv(
+    "SEEN_URLS_PATH", os.path.join(os.path.dirname(__file__), "news", "naver", ".seen_urls.sqlite")
+)
+
+
+class SeenUrlIndex:
+
+    """
+    이미 내려받은 기사 URL과 본문을 저장하는 SQLite 인덱스 (실행 간에 유지됨)
+    """
+
+    def __init__(self, path: str = SEEN_URLS_PATH):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS articles ("
+                "url TEXT PRIMARY KEY, content TEXT NOT NULL, fetched_at TEXT NOT NULL)"
+            )
+
+    def get(self, url: str):
+        with self.lock:
+            row = self.connection.execute("SELECT content FROM articles WHERE url = ?", (url,)).fetchone()
+        return None if row is None else row[0]
+
+    def put(self, url: str, content: str):
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO articles (url, content, fetched_at) VALUES (?, ?, ?)",
+                (url, content, datetime.now().isoformat(timespec="seconds")),
+            )
@@ -0,0 +1,138 @@
+import os
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from functools import reduce
+from langchain.docstore.document import Document
+from dotenv import load_dotenv
+
+from data.korea_investment import company_currency, company_display_names, get_unsettled_start, render_dates, render_prices, render_price_frame
+
+load_dotenv(override=True)
+
+# 일별 문서는 가격 분석 도구가 대신하므로 기본으로는 주간·월간 요약 문서만 만든다
+STOCK_DAILY_DOCUMENTS = os.getenv("STOCK_DAILY_DOCUMENTS", "false").lower() == "true"
+VOLUME_LOOKBACK_PERIODS = 12
+
+# 이름: (pandas 기간, 문서 표기, 직전 기간 표기, 거래량 비교 기간 표기)
+ROLLUP_PERIODS = {
+    "weekly": ("W-FRI", "주간", "전주", f"직전 {VOLUME_LOOKBACK_PERIODS}주"),
+    "monthly": ("ME", "월간", "전월", f"직전 {VOLUME_LOOKBACK_PERIODS}개월"),
+}
+
+
+def lookback_start(start_date: str) -> str:
+
+    """
+    start_date("YYYYMMDD")가 속한 주·월의 처음과 거래량 비교 기간까지 포함하도록 앞당긴 조회 시작일
+    """
+    start = pd.Timestamp(datetime.strptime(start_date, "%Y%m%d"))
+    start = start.to_period("M").start_time - pd.DateOffset(months=VOLUME_LOOKBACK_PERIODS + 1)
+    return start.strftime("%Y%m%d")
+
+
+def rollup(df: pd.DataFrame, freq: str) -> pd.DataFrame:
+
+    """
+    일봉을 회사별·기간별 OHLC로 묶고 직전 기간 대비 등락률과 거래량 비율을 계산
+
+    Returns:
+        DataFrame (column : 회사명, 기간 끝, 시작일, 종료일, 시가, 최고가, 최저가, 종가, 거래일, 일평균 거래량, 등락률, 거래량 비율)
+    """
+    grouped = df.groupby(['회사명', pd.Grouper(key='날짜', freq=freq)], observed=True)
+    result = grouped.agg(
+        시작일=('날짜', 'min'),
+        종료일=('날짜', 'max'),
+        시가=('시가', 'first'),
+        최고가=('최고가', 'max'),
+        최저가=('최저가', 'min'),
+        종가=('종가', 'last'),
+        거래량=('거래량', 'sum'),
+        거래일=('날짜', 'size'),
+    ).reset_index().rename(columns={'날짜': '기간 끝'})
+    result = result[result['거래일'] > 0].reset_index(drop=True)
+
+    by_company = result.groupby('회사명', observed=True)
+    previous_close = by_company['종가'].shift(1).fillna(result['시가'])
+    result['등락률'] = (result['종가'].astype('float64') / previous_close - 1) * 100
+    result['일평균 거래량'] = result['거래량'] / result['거래일']
+    trailing_volume = (
+        result.groupby('회사명', observed=True)['일평균 거래량']
+        .transform(lambda volume: volume.shift(1).rolling(VOLUME_LOOKBACK_PERIODS, min_periods=1).mean())
+    )
+    result['거래량 비율'] = (result['일평균 거래량'] / trailing_volume - 1) * 100
+    return result
+
+
+def render_percent(values: pd.Series) -> pd.Series:
+    sign = pd.Series(np.where(values >= 0, '+', ''), index=values.index)
+    return sign + values.round(2).astype(str) + '%'
+
+
+def rollup_documents(df: pd.DataFrame, start_date: str, end_date: str) -> list[Document]:
+
+    """
+    start_date~end_date("YYYYMMDD")에 걸친 주간·월간 요약 문서
+
+    끝나지 않은 기간은 내용이 계속 바뀌므로 기간의 마지막 날까지 장이 끝난(시세가 확정된) 기간만 만든다.
+    요청 기간과 겹치는 기간에 더해 회사별로 가장 최근에 끝난 기간도 만든다.
+    start_date = end_date = 오늘로 매일 돌려도 그 사이 끝난 지난주·지난달 요약이 색인된다
+    (이미 색인된 문서는 같은 ID라 다시 임베딩하지 않는다).
+    """
+    start = pd.Timestamp(datetime.strptime(start_date, "%Y%m%d"))
+    end = pd.Timestamp(datetime.strptime(end_date, "%Y%m%d"))
+    unsettled_start = {
+        display_name: pd.Timestamp(datetime.strptime(get_unsettled_start(ticker), "%Y%m%d"))
+        for ticker, display_name in company_display_names.items()
+    }
+    documents = []
+    for freq, label, previous_label, volume_label in ROLLUP_PERIODS.values():
+        periods = rollup(df, freq)
+        periods = periods[periods['기간 끝'] < periods['회사명'].astype(str).map(unsettled_start)]
+        overlaps = (periods['기간 끝'] >= start) & (periods['시작일'] <= end)
+        latest = periods['기간 끝'] == periods.groupby('회사명', observed=True)['기간 끝'].transform('max')
+        periods = periods[overlaps | latest]
+        if periods.empty:
+            continue
+
+        company = periods['회사명'].astype(str)
+        currency = company.map(df.attrs.get('currency', company_currency)).fillna('')
+        first_day = render_dates(periods['시작일'])
+        last_day = render_dates(periods['종료일'])
+        if freq == "ME":
+            period = periods['기간 끝'].dt.year.astype(str) + '년 ' + periods['기간 끝'].dt.month.astype(str) + '월'
+        else:
+            period = first_day + '~' + last_day
+        volume_ratio = periods['거래량 비율']
+        # 비교할 직전 기간이 없으면 거래량 비율은 쓰지 않는다
+        volume_note = (f' ({volume_label} 평균 대비 ' + render_percent(volume_ratio.fillna(0)) + ')').where(volume_ratio.notna(), '')
+        content = (
+            '기간 : ' + period + f' ({label}), 회사명 : ' + company
+            + ', 시가 : ' + render_prices(periods['시가'], currency)
+            + ', 최고가 : ' + render_prices(periods['최고가'], currency)
+            + ', 최저가 : ' + render_prices(periods['최저가'], currency)
+            + ', 종가 : ' + render_prices(periods['종가'], currency)
+            + f', 등락률({previous_label} 종가 대비) : ' + render_percent(periods['등락률'])
+            + ', 거래일 : ' + periods['거래일'].astype(str) + '일'
+            + ', 일평균 거래량 : ' + periods['일평균 거래량'].round().astype('int64').astype(str)
+            + volume_note
+        )
+        name = period + ' ' + company + f' {label} 주가 정보'
+        documents.extend(
+            Document(page_content=page_content, metadata={"name": doc_name, "category": "stock", "updated_at": updated_at})
+            for page_content, doc_name, updated_at in zip(content, name, last_day)
+        )
+    return documents
+
+
+def daily_documents(df: pd.DataFrame) -> list[Document]:
+    rendered = render_price_frame(df)
+    content = reduce(
+        lambda left, right: left + ', ' + right,
+        (f'{col} : ' + rendered[col] for col in rendered.columns),
+    )
+    name = rendered['날짜'] + ' ' + rendered['회사명'] + ' 주가 정보'
+    return [
+        Document(page_content=page_content, metadata={"name": doc_name, "category": "stock", "updated_at": updated_at})
+        for page_content, doc_name, updated_at in zip(content, name, rendered['날짜'])
+    ]
@@ -23,8 +23,11 @@ enum STREAMING_EVENTS {
   SESSION_ID = '[SESSION_ID]',
   SOURCE = '[SOURCE]',
   DONE = '[DONE]',
+  EVAL_ID = '[EVAL_ID]',
   EVAL = '[EVAL]',
 }
+const EVAL_POLL_INTERVAL_MS = 3000
+const EVAL_POLL_ATTEMPTS = 40
 
 const GLOBAL_STATE: GlobalStateType = {
   status: AppStatus.Idle,
@@ -38,6 +41,41 @@ const API_HOST = process.env.REACT_APP_API_HOST || 'http://localhost:5000/api'
 //const API_HOST = process.env.REACT_APP_API_HOST || 'http://3.35.111.226:5000/api'
 
 let abortController: AbortController | null = null
+
+const sleep = (ms: number) => new Promise((resolve) => setTimeout(resolve, ms))
+
+// 답변 평가는 백그라운드에서 실행되므로 /api/eval에 결과가 저장될 때까지 조회한다
+const pollEvalScores = async (
+  sessionId: string,
+  evalId: string,
+  isReceived: () => boolean
+) => {
+  for (let attempt = 0; attempt < EVAL_POLL_ATTEMPTS; attempt++) {
+    await sleep(EVAL_POLL_INTERVAL_MS)
+    if (isReceived()) {
+      return null
+    }
+    try {
+      const response = await fetch(
+        `${API_HOST}/eval?session_id=${sessionId}&eval_id=${evalId}`
+      )
+      if (!response.ok) {
+        continue
+      }
+      const [result] = await response.json()
+      if (result) {
+        return {
+          'Context Relavance': String(result.context_relevance),
+          Groundedness: String(result.groundedness),
+          'Answer Relavance': String(result.answer_relevance),
+        }
+      }
+    } catch (e) {
+      console.error(e)
+    }
+  }
+  return null
+}
 const globalSlice = createSlice({
   name: 'global',
   initialState: GLOBAL_STATE as GlobalStateType,
@@ -174,6 +212,7 @@ export const thunkActions = {
 
       let countRetiresError = 0
       let message = ''
+      let evalReceived = false
       const sessionId = getState().sessionId
       const sourcesMap: Map<
         string,
@@ -234,7 +273,22 @@ export const thunkActions = {
                 console.log('error', source, event.data)
                 console.error(e)
               }
+            } else if (event.data.startsWith(STREAMING_EVENTS.EVAL_ID)) {
+              const evalId = event.data.split(' ')[1].trim()
+              const evalSessionId = getState().sessionId
+              if (evalSessionId) {
+                pollEvalScores(evalSessionId, evalId, () => evalReceived).then(
+                  (evalScores) => {
+                    if (evalScores) {
+                      dispatch(
+                        actions.setEvalScores({ id: conversationId, evalScores })
+                      )
+                    }
+                  }
+                )
+              }
             } else if (event.data.startsWith(STREAMING_EVENTS.EVAL)) {
+              evalReceived = true
               const evalPairs = event.data.replace('[EVAL] ', '').split(', ')
               const evalScores = {}
               evalPairs.forEach((pair) => {
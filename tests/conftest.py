@@ -0,0 +1,7 @@
+import os
+import sys
+
+# data 패키지는 저장소 루트에서, api 모듈은 api 디렉터리에서 import한다
+basedir = os.path.abspath(os.path.dirname(__file__))
+sys.path.insert(0, f"{basedir}/..")
+sys.path.insert(0, f"{basedir}/../api")
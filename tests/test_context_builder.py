@@ -0,0 +1,36 @@
+from langchain_core.documents import Document
+
+from context_builder import build_context
+
+SOURCE_URL = "https://example.com/news/1"
+TEXT = " ".join(f"word{i}" for i in range(400))
+
+
+def chunk(start: int, end: int, score: float, start_index: bool = False) -> tuple[Document, float]:
+    metadata = {"name": "news", "url": SOURCE_URL}
+    if start_index:
+        metadata["start_index"] = start
+    return Document(page_content=TEXT[start:end], metadata=metadata), score
+
+
+def test_overlapping_chunks_merge_regardless_of_order():
+    # i, i+2, i+1 순서로 와도 i+1을 합친 뒤 i+2까지 하나로 합쳐야 한다
+    scored_docs = [chunk(0, 600, 0.9), chunk(800, 1400, 0.8), chunk(400, 1000, 0.7)]
+
+    docs = build_context(scored_docs)
+
+    assert [doc.page_content for doc in docs] == [TEXT[:1400]]
+
+
+def test_adjacent_chunks_merge_by_start_index():
+    # 겹치지 않고 공백 하나를 사이에 두고 맞닿은 청크 (분할기가 경계의 공백을 지운다)
+    boundary = TEXT.index(" ", 500)
+    scored_docs = [
+        chunk(boundary + 1, 1200, 0.9, start_index=True),
+        chunk(0, boundary, 0.8, start_index=True),
+        chunk(1500, 1800, 0.7, start_index=True),
+    ]
+
+    docs = build_context(scored_docs)
+
+    assert [doc.page_content for doc in docs] == [TEXT[:1200], TEXT[1500:1800]]
@@ -0,0 +1,50 @@
+import pandas as pd
+import pytest
+
+pytest.importorskip("mojito")
+
+from data import korea_investment
+from data.korea_investment import set_price_dtypes
+from data.stock_documents import rollup_documents
+
+
+def price_frame(last_day: str) -> pd.DataFrame:
+    days = pd.bdate_range(end=pd.Timestamp(last_day), periods=120)
+    frames = [
+        pd.DataFrame({
+            '날짜': days, '회사명': company,
+            '시가': 100.0, '최고가': 110.0, '최저가': 90.0, '종가': 105.0, '거래량': 1000,
+        })
+        for company in ["삼성전자", "AMD"]
+    ]
+    return set_price_dtypes(pd.concat(frames, ignore_index=True))
+
+
+def rollup_names(monkeypatch, today: str, last_day: str) -> set[str]:
+    # flask update-stock 기본값처럼 start_date = end_date = 오늘로 실행
+    monkeypatch.setattr(korea_investment, "get_current_date", lambda: today)
+    return {doc.metadata["name"] for doc in rollup_documents(price_frame(last_day), today, today)}
+
+
+def test_today_only_run_builds_latest_settled_periods(monkeypatch):
+    # 2026-10-18(일): 지난주(10/12~10/16)와 지난달(9월) 요약이 만들어져야 한다
+    names = rollup_names(monkeypatch, "20261018", "20261016")
+
+    assert names == {
+        "2026년 10월 12일~2026년 10월 16일 삼성전자 주간 주가 정보",
+        "2026년 10월 12일~2026년 10월 16일 AMD 주간 주가 정보",
+        "2026년 9월 삼성전자 월간 주가 정보",
+        "2026년 9월 AMD 월간 주가 정보",
+    }
+
+
+def test_unsettled_periods_are_skipped(monkeypatch):
+    # 2026-10-16(금) 장중: 이번 주와 이번 달은 아직 끝나지 않았다
+    names = rollup_names(monkeypatch, "20261016", "20261016")
+
+    assert names == {
+        "2026년 10월 5일~2026년 10월 9일 삼성전자 주간 주가 정보",
+        "2026년 10월 5일~2026년 10월 9일 AMD 주간 주가 정보",
+        "2026년 9월 삼성전자 월간 주가 정보",
+        "2026년 9월 AMD 월간 주가 정보",
+    }